@@ -1,16 +1,41 @@
-import pygame
 import random
 import csv
 import time
 import os
+import importlib
+import pickle
+import hashlib
+import itertools
+import threading
+import queue
+from collections import namedtuple
+from array import array
 from datetime import datetime
 
+# --- Carga diferida de pygame ---
+class _LazyModule:
+    """Importa el módulo en el primer acceso a uno de sus atributos.
+
+    La lógica de simulación (load_table, sense, decide, ejecutar...) no necesita
+    pygame; solo se carga cuando se abre una ventana o se dibuja algo. Tras la
+    primera carga el nombre global se reemplaza por el módulo real.
+    """
+
+    def __init__(self, name):
+        self._name = name
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._name)
+        globals()[self._name] = module
+        return getattr(module, attr)
+
+pygame = _LazyModule("pygame")
+
 TABLES_FOLDER = "tablas"
-FILE_NAME = None  # Se establecerá dinámicamente
 
 # --- Parámetros del entorno ---
-ROWS, COLS = 11, 11  # Valores por defecto, se pueden cambiar desde el menú
-CELL_SIZE = 50  # Se ajusta automáticamente según el tamaño del mapa
+ROWS, COLS = 11, 11  # Valores por defecto; cada World guarda sus propias dimensiones
+CELL_SIZE = 50  # Valor por defecto; run_simulation lo ajusta por World según el tamaño del mapa
 FPS = 60  # Aumentar FPS para animaciones más fluidas
 #STEP_DELAY = 0.7
 STEP_DELAY = 0.1
@@ -25,30 +50,188 @@ TEXT = (20, 20, 20)
 
 DENSITY = 0.3
 
+# --- Formato del archivo de salida ---
+CSV_HEADER = [
+    "#", "Pos", "Orientación", "Piso", "Izquierda", "Centro",
+    "Derecha", "Contacto", "Regla", "Acción", "Nueva Pos", "Nueva Orientación"
+]
+ORIENT_SYMBOLS = {'N': '^', 'E': '>', 'S': 'v', 'W': '<'}
+
+TABLE_PAGE_SIZE = 8  # Tablas por página en el menú de selección
+
 # --- Funciones para manejo de tablas ---
+TABLE_DESCRIPTIONS = {
+    "percepcion-accion.csv": "Tabla Original - Comportamiento básico",
+    "percepcion-accion2.csv": "Tabla Alternativa - Estrategia diferente",
+    "conservador.csv": "Tabla Conservadora - Siempre gira a la derecha",
+}
+TABLE_INDEX_FILE = ".indice-tablas.pickle"
+TABLE_INDEX_VERSION = 1
+# piso (0/1) x izquierda, centro, derecha (P/./L) x contacto (0/1)
+FREE_EDIT_LOG_MIN = 1024  # Ediciones del índice de celdas libres antes de compactar el registro
+
+NUM_PERCEPTIONS = 2 * 3 * 3 * 3 * 2
+
+def describe_table(filename, comments=()):
+    """Descripción de una tabla: primer comentario de cabecera que no sea la leyenda de columnas"""
+    for comment in comments:
+        if comment and not comment.startswith("piso"):
+            return comment
+    return TABLE_DESCRIPTIONS.get(filename, f"Tabla Personalizada - {filename}")
+
+def table_metadata(filename, table, comments=()):
+    """Metadatos que muestra el menú: reglas, cobertura de percepciones, acciones y descripción"""
+    valid = [k for k in table
+             if k[0] in "01" and k[4] in "01" and all(v in "P.L" for v in k[1:4])]
+    return {
+        "descripcion": describe_table(filename, comments),
+        "num_reglas": len(table),
+        "cobertura": len(valid) / NUM_PERCEPTIONS,
+        "acciones": sorted({a for acciones in table.values() for a in acciones}),
+        "error": None,
+    }
+
+def invalid_table_metadata(filename, error):
+    """Metadatos de un archivo que no se pudo leer como tabla; `error` explica por qué"""
+    return {"descripcion": f"Tabla inválida - {filename}", "num_reglas": 0, "cobertura": 0.0, "acciones": [],
+            "error": error}
+
+class TableIndex:
+    """Índice en disco de la carpeta de tablas, con metadatos y tablas ya compiladas.
+
+    Cada entrada se identifica por nombre de archivo, mtime y tamaño: refresh()
+    solo vuelve a parsear los archivos nuevos o modificados y descarta los
+    borrados, así que abrir el menú con miles de tablas no lee ningún CSV.
+    Un archivo mal formado queda en el índice como tabla inválida (con el error
+    en sus metadatos) en lugar de interrumpir el recorrido de la carpeta.
+    """
+
+    def __init__(self, folder=TABLES_FOLDER, path=None):
+        self.folder = folder
+        self.path = path or os.path.join(folder, TABLE_INDEX_FILE)
+        self.entries = {}
+        self.names = []
+        self._keys = {}
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+            if data.get("version") == TABLE_INDEX_VERSION:
+                self.entries = data["entries"]
+        except Exception:
+            # Índice ausente o dañado: se reconstruye en el siguiente refresh()
+            self.entries = {}
+        self.names = sorted(self.entries)
+
+    def save(self):
+        """Escribe el índice de forma atómica (archivo temporal + os.replace)"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                pickle.dump({"version": TABLE_INDEX_VERSION, "entries": self.entries}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError:
+            # El índice es solo una caché: si no se puede escribir, se sigue sin él
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _update(self, filename, stat):
+        signature = (stat.st_mtime_ns, stat.st_size)
+        entry = self.entries.get(filename)
+        if entry is None or entry["firma"] != signature:
+            try:
+                table, rule_index, comments = parse_table(os.path.join(self.folder, filename))
+            except (ValueError, OSError, csv.Error) as e:
+                # Fila con columnas de menos, codificación incorrecta, archivo ilegible...
+                entry = {
+                    "firma": signature,
+                    "metadatos": invalid_table_metadata(filename, f"{type(e).__name__}: {e}"),
+                    "tabla": None,
+                    "reglas": None,
+                }
+            else:
+                # Compartir las claves de percepción entre tablas: pickle las guarda una sola vez
+                table = {self._keys.setdefault(k, k): v for k, v in table.items()}
+                rule_index = {self._keys.setdefault(k, k): v for k, v in rule_index.items()}
+                entry = {
+                    "firma": signature,
+                    "metadatos": table_metadata(filename, table, comments),
+                    "tabla": table,
+                    "reglas": rule_index,
+                }
+            self.entries[filename] = entry
+            self._dirty = True
+        return entry
+
+    def refresh(self):
+        """Sincroniza el índice con la carpeta y devuelve los nombres ordenados"""
+        os.makedirs(self.folder, exist_ok=True)
+        seen = set()
+        with os.scandir(self.folder) as it:
+            for item in it:
+                if item.name.endswith('.csv') and item.is_file():
+                    seen.add(item.name)
+                    self._update(item.name, item.stat())
+        for filename in set(self.entries) - seen:
+            del self.entries[filename]
+            self._dirty = True
+        if self._dirty:
+            self.save()
+        self.names = sorted(self.entries)
+        return self.names
+
+    def compiled(self, filename):
+        """(tabla, índices de regla) ya parseados; solo relee el archivo si cambió"""
+        known = filename in self.entries
+        entry = self._update(filename, os.stat(os.path.join(self.folder, filename)))
+        if not known:
+            self.names = sorted(self.entries)
+        if self._dirty:
+            self.save()
+        if entry["tabla"] is None:
+            raise ValueError(f"La tabla {filename} no es válida: {entry['metadatos']['error']}")
+        return entry["tabla"], entry["reglas"]
+
+    def metadata(self, filename):
+        entry = self.entries.get(filename)
+        if entry is None:
+            return {"descripcion": describe_table(filename), "num_reglas": 0, "cobertura": 0.0, "acciones": [],
+                    "error": None}
+        return entry["metadatos"]
+
+    def is_valid(self, filename):
+        entry = self.entries.get(filename)
+        return entry is not None and entry["tabla"] is not None
+
+    def filter(self, text):
+        """Nombres cuyo archivo o descripción contienen `text` (sin distinguir mayúsculas)"""
+        text = text.strip().lower()
+        if not text:
+            return self.names
+        return [name for name in self.names
+                if text in name.lower() or text in self.entries[name]["metadatos"]["descripcion"].lower()]
+
+_table_index = None
+
+def get_table_index():
+    """Índice de tablas del proceso, cargado desde disco la primera vez"""
+    global _table_index
+    if _table_index is None:
+        _table_index = TableIndex()
+    return _table_index
+
 def get_available_tables():
     """Detecta automáticamente todas las tablas CSV disponibles en la carpeta tablas/"""
-    tables = []
-    if not os.path.exists(TABLES_FOLDER):
-        os.makedirs(TABLES_FOLDER, exist_ok=True)
-        return tables
-    
-    for filename in os.listdir(TABLES_FOLDER):
-        if filename.endswith('.csv'):
-            tables.append(filename)
-    
-    return sorted(tables)
+    return list(get_table_index().refresh())
 
 def get_table_description(filename):
-    """Obtiene una descripción de la tabla basada en su nombre"""
-    descriptions = {
-        "percepcion-accion.csv": "Tabla Original - Comportamiento básico",
-        "percepcion-accion2.csv": "Tabla Alternativa - Estrategia diferente",
-        "conservador.csv": "Tabla Conservadora - Siempre gira a la derecha",
-    }
-    
-    # Si no hay descripción específica, usar el nombre del archivo
-    return descriptions.get(filename, f"Tabla Personalizada - {filename}")
+    """Obtiene la descripción de la tabla desde el índice (cabecera del CSV o nombre)"""
+    return get_table_index().metadata(filename)["descripcion"]
 
 def get_direction_arrow(orientation):
     """Devuelve la flecha direccional correspondiente a la orientación"""
@@ -91,7 +274,10 @@ def show_table_selection_menu(screen):
                         return None
         return None
     
-    # Selección por defecto (primera opción)
+    # Selección por defecto (primera opción), filtro escrito y página actual
+    index = get_table_index()
+    filter_text = ""
+    visible = tables
     selected_index = 0
     
     # Loop principal
@@ -102,12 +288,22 @@ def show_table_selection_menu(screen):
         
         # Título
         title = font_title.render("SELECCIÓN DE TABLA DE REGLAS", True, TEXT)
-        title_rect = title.get_rect(center=(screen.get_width()//2, 80))
+        title_rect = title.get_rect(center=(screen.get_width()//2, 60))
         screen.blit(title, title_rect)
         
-        # Mostrar opciones de tablas
+        # Filtro y página
+        page = selected_index // TABLE_PAGE_SIZE
+        pages = max(1, (len(visible) + TABLE_PAGE_SIZE - 1) // TABLE_PAGE_SIZE)
+        filter_line = f"Filtro: {filter_text}_   ({len(visible)} de {len(tables)} tablas, página {page + 1}/{pages})"
+        filter_surface = font_instruction.render(filter_line, True, TEXT)
+        screen.blit(filter_surface, filter_surface.get_rect(center=(screen.get_width()//2, 105)))
+        
+        # Mostrar solo las tablas de la página actual
         y_offset = 150
-        for i, table in enumerate(tables):
+        if not visible:
+            empty = font_option.render("Sin coincidencias", True, RED)
+            screen.blit(empty, empty.get_rect(center=(screen.get_width()//2, y_offset)))
+        for i in range(page * TABLE_PAGE_SIZE, min(len(visible), (page + 1) * TABLE_PAGE_SIZE)):
             # Determinar color según si está seleccionada
             if i == selected_index:
                 text_color = BLUE
@@ -116,15 +312,36 @@ def show_table_selection_menu(screen):
                 text_color = TEXT
                 prefix = "  "
             
-            option_text = f"{prefix}{table}"
+            option_text = f"{prefix}{visible[i]}"
+            if not index.is_valid(visible[i]):
+                # Las tablas que no se pudieron leer se listan, pero no se pueden elegir
+                option_text += " (inválida)"
+                text_color = RED
             option = font_option.render(option_text, True, text_color)
             option_rect = option.get_rect(center=(screen.get_width()//2, y_offset))
             screen.blit(option, option_rect)
-            y_offset += 40
+            y_offset += 36
+        
+        # Metadatos de la tabla seleccionada (desde el índice, sin leer el CSV)
+        y_offset = 150 + TABLE_PAGE_SIZE * 36
+        if visible:
+            meta = index.metadata(visible[selected_index])
+            if meta.get("error"):
+                info_lines = [meta["descripcion"], meta["error"][:80]]
+            else:
+                info_lines = [
+                    meta["descripcion"],
+                    f"{meta['num_reglas']} reglas, cobertura {meta['cobertura']:.0%} de {NUM_PERCEPTIONS} percepciones",
+                    "Acciones: " + ", ".join(meta["acciones"]),
+                ]
+            for line in info_lines:
+                info = font_instruction.render(line, True, TEXT)
+                screen.blit(info, info.get_rect(center=(screen.get_width()//2, y_offset)))
+                y_offset += 22
         
         # Instrucciones
         inst1 = font_instruction.render("Usa las flechas ↑↓ para navegar, ENTER para seleccionar", True, TEXT)
-        inst2 = font_instruction.render("• ESC: Salir", True, TEXT)
+        inst2 = font_instruction.render("• RePág/AvPág: Cambiar página  • Escribe para filtrar  • ESC: Salir", True, TEXT)
         
         inst1_rect = inst1.get_rect(center=(screen.get_width()//2, y_offset + 20))
         inst2_rect = inst2.get_rect(center=(screen.get_width()//2, y_offset + 50))
@@ -142,14 +359,31 @@ def show_table_selection_menu(screen):
                 if event.key == pygame.K_ESCAPE:
                     return None
                 elif event.key == pygame.K_RETURN:
-                    return tables[selected_index]
+                    if visible and index.is_valid(visible[selected_index]):
+                        return visible[selected_index]
+                elif not visible:
+                    pass
                 elif event.key == pygame.K_UP:
-                    selected_index = (selected_index - 1) % len(tables)
+                    selected_index = (selected_index - 1) % len(visible)
                 elif event.key == pygame.K_DOWN:
-                    selected_index = (selected_index + 1) % len(tables)
+                    selected_index = (selected_index + 1) % len(visible)
+                elif event.key == pygame.K_PAGEUP:
+                    selected_index = max(0, selected_index - TABLE_PAGE_SIZE)
+                elif event.key == pygame.K_PAGEDOWN:
+                    selected_index = min(len(visible) - 1, selected_index + TABLE_PAGE_SIZE)
+                
+                # Filtro: cualquier carácter imprimible lo amplía, BACKSPACE lo acorta
+                if event.key == pygame.K_BACKSPACE:
+                    filter_text = filter_text[:-1]
+                elif event.unicode and event.unicode.isprintable() and event.key != pygame.K_RETURN:
+                    filter_text += event.unicode
+                else:
+                    continue
+                visible = index.filter(filter_text)
+                selected_index = 0
 
 # --- Crear mapa ---
-def create_map(rows, cols, density=DENSITY):
+def create_map(rows, cols, density=DENSITY, rng=random):
     grid = []
     for r in range(rows):
         row = []
@@ -157,38 +391,176 @@ def create_map(rows, cols, density=DENSITY):
             if r == 0 or r == rows - 1 or c == 0 or c == cols - 1:
                 row.append(-1)
             else:
-                row.append(1 if random.random() < density else 0)
+                row.append(1 if rng.random() < density else 0)
         grid.append(row)
     return grid
 
 # --- Cargar tabla percepción-acción ---
-def load_table(filename):
+def parse_table(filepath):
+    """Lee un CSV de reglas y devuelve (tabla, índices de regla, comentarios de cabecera)"""
     table = {}
     rule_index = {}  # <--- Nuevo diccionario para guardar número de regla
-    filepath = os.path.join(TABLES_FOLDER, filename)
+    comments = []
     with open(filepath, newline='', encoding='utf-8') as csvfile:
         reader = csv.reader(csvfile)
         line_num = 0
         for row in reader:
-            if not row or row[0].startswith('#'):
+            if not row:
+                continue
+            if row[0].startswith('#'):
+                comments.append(",".join(row)[1:].strip())
                 continue
             line_num += 1
             piso, izq, cen, der, contacto, *acciones = [x.strip() for x in row]
             key = (piso, izq, cen, der, contacto)
             table[key] = acciones
             rule_index[key] = line_num  # <--- Guarda el número de regla
+    return table, rule_index, comments
+
+def load_table(filename):
+    table, rule_index, _ = parse_table(os.path.join(TABLES_FOLDER, filename))
     return table, rule_index
-    
+
+# --- Mundo ---
+class World:
+    """Estado autocontenido de una simulación: mapa, dimensiones, tabla, RNG y tamaño de celda.
+
+    Permite tener varias simulaciones de distinto tamaño en un mismo proceso o
+    hilo. Mantiene un índice de celdas libres (lista + posición de cada celda)
+    para colocar agentes en O(1) y actualizarlo en O(1) cuando cambia una celda.
+    """
+
+    def __init__(self, grid, table_name=None, rng=None, cell_size=CELL_SIZE, tabla=None, rule_indices=None):
+        self.grid = grid
+        self.rows, self.cols = len(grid), len(grid[0])
+        self.table_name = table_name
+        if tabla is None and table_name is not None:
+            tabla, rule_indices = load_table(table_name)
+        self.tabla, self.rule_indices = tabla, rule_indices
+        self.rng = rng if rng is not None else random.Random()
+        self.cell_size = cell_size
+        self._free_cells = None  # Se construye al primer uso
+        self._free_pos = None
+        self._free_count = None  # Conteo sin índice, para quien solo necesita cuántas celdas hay
+        # Cambios pared/libre hechos con el índice ya construido, como (fila, col, antes, después):
+        # junto con el orden base alcanzan para reproducir el orden exacto del índice
+        self._free_edits = []
+        self._free_base = None  # Orden del índice al compactar las ediciones (array('i') de fila*cols+col)
+
+    @classmethod
+    def generate(cls, rows, cols, density=DENSITY, table_name=None, seed=None, cell_size=CELL_SIZE,
+                 tabla=None, rule_indices=None):
+        """Crea un mapa con create_map usando un RNG propio (reproducible si se da `seed`)"""
+        rng = random.Random(seed)
+        grid = create_map(rows, cols, density=density, rng=rng)
+        return cls(grid, table_name, rng=rng, cell_size=cell_size, tabla=tabla, rule_indices=rule_indices)
+
+    def _build_free_index(self):
+        self._free_cells = [
+            (r, c) for r in range(self.rows) for c in range(self.cols) if self.grid[r][c] != -1
+        ]
+        self._free_pos = {cell: i for i, cell in enumerate(self._free_cells)}
+
+    @property
+    def free_cells(self):
+        if self._free_cells is None:
+            self._build_free_index()
+        return self._free_cells
+
+    @property
+    def free_count(self):
+        """Cantidad de celdas libres; no construye el índice si todavía no existe"""
+        if self._free_cells is not None:
+            return len(self._free_cells)
+        if self._free_count is None:
+            self._free_count = sum(1 for row in self.grid for val in row if val != -1)
+        return self._free_count
+
+    def random_free_cell(self):
+        free = self.free_cells
+        if not free:
+            raise ValueError("El mapa no tiene celdas libres")
+        return free[self.rng.randrange(len(free))]
+
+    def in_bounds(self, r, c):
+        return 0 <= r < self.rows and 0 <= c < self.cols
+
+    def set_cell(self, r, c, value):
+        """Cambia el valor de una celda manteniendo el índice de celdas libres"""
+        old = self.grid[r][c]
+        self.grid[r][c] = value
+        if (old == -1) == (value == -1):
+            return
+        if self._free_count is not None:
+            self._free_count += 1 if old == -1 else -1
+        if self._free_cells is None:
+            return
+        self._free_edits.append((r, c, old, value))
+        if value == -1:
+            # Quitar en O(1): mover la última celda al hueco
+            i = self._free_pos.pop((r, c))
+            last = self._free_cells.pop()
+            if last != (r, c):
+                self._free_cells[i] = last
+                self._free_pos[last] = i
+        else:
+            self._free_pos[(r, c)] = len(self._free_cells)
+            self._free_cells.append((r, c))
+        if len(self._free_edits) > max(FREE_EDIT_LOG_MIN, len(self._free_cells) // 16):
+            # Demasiadas ediciones: guardar el orden actual empaquetado y empezar un registro nuevo
+            self._free_base = array("i", [fr * self.cols + fc for fr, fc in self._free_cells]).tobytes()
+            self._free_edits = []
+
+    def get_state(self):
+        """Estado serializable: mapa (un byte por celda), RNG y lo necesario para el orden del índice"""
+        return {
+            "filas": self.rows,
+            "columnas": self.cols,
+            "grid": array("b", itertools.chain.from_iterable(self.grid)).tobytes(),
+            "rng": self.rng.getstate(),
+            # El orden del índice decide qué celda elige random_free_cell(). No se guarda
+            # entero en cada checkpoint: solo el orden base (si hubo muchas ediciones) y
+            # las ediciones posteriores, que nunca pasan de FREE_EDIT_LOG_MIN o 1/16 del índice
+            "indice_construido": self._free_cells is not None,
+            "indice_base": self._free_base,
+            "ediciones_libres": list(self._free_edits),
+        }
+
+    @classmethod
+    def from_state(cls, state, table_name=None, cell_size=CELL_SIZE, tabla=None, rule_indices=None):
+        rows, cols = state["filas"], state["columnas"]
+        cells = array("b", state["grid"])
+        grid = [cells[r * cols:(r + 1) * cols].tolist() for r in range(rows)]
+        rng = random.Random()
+        rng.setstate(state["rng"])
+        world = cls(grid, table_name, rng=rng, cell_size=cell_size, tabla=tabla, rule_indices=rule_indices)
+        if state["indice_construido"]:
+            # Volver el mapa al momento del orden base, reconstruir el índice y repetir las
+            # ediciones en orden: set_cell deja el índice igual que en la ejecución original
+            edits = state["ediciones_libres"]
+            current = {(r, c): grid[r][c] for r, c, _, _ in edits}
+            for r, c, old, _ in reversed(edits):
+                grid[r][c] = old
+            if state["indice_base"] is not None:
+                world._free_base = state["indice_base"]
+                world._free_cells = [divmod(i, cols) for i in array("i", world._free_base)]
+                world._free_pos = {cell: i for i, cell in enumerate(world._free_cells)}
+            else:
+                world._build_free_index()
+            for r, c, _, value in edits:
+                world.set_cell(r, c, value)
+            # Cambios línea/blanco posteriores no quedan en el registro: restaurar el valor final
+            for (r, c), value in current.items():
+                grid[r][c] = value
+        return world
+
 # --- Clase Agente ---
 class Agent:
-    def __init__(self, grid):
-        self.orient = random.choice(['N', 'E', 'S', 'W'])
-        while True:
-            r = random.randint(1, ROWS - 2)
-            c = random.randint(1, COLS - 2)
-            if grid[r][c] != -1:
-                self.x, self.y = r, c
-                break
+    def __init__(self, world, x=None, y=None, orient=None):
+        self.orient = orient if orient is not None else world.rng.choice(['N', 'E', 'S', 'W'])
+        if x is None or y is None:
+            x, y = world.random_free_cell()
+        self.x, self.y = x, y
         self.contact = '0'
 
     def rotate(self, delta):
@@ -196,18 +568,19 @@ class Agent:
         idx = dirs.index(self.orient)
         self.orient = dirs[(idx + delta) % 4]
 
-    def forward(self, grid):
+    def forward(self, world):
         moves = {'N': (-1, 0), 'E': (0, 1), 'S': (1, 0), 'W': (0, -1)}
         dx, dy = moves[self.orient]
         nx, ny = self.x + dx, self.y + dy
-        if 0 <= nx < ROWS and 0 <= ny < COLS and grid[nx][ny] != -1:
+        if world.in_bounds(nx, ny) and world.grid[nx][ny] != -1:
             self.x, self.y = nx, ny
             self.contact = '0'
         else:
             self.contact = '1'
 
 # --- Percepción ---
-def sense(grid, agent):
+def sense(world, agent):
+    grid = world.grid
     piso = '1' if grid[agent.x][agent.y] == 1 else '0'
     contact = agent.contact
 
@@ -221,7 +594,7 @@ def sense(grid, agent):
     left, center, right = '.', '.', '.'
     for i, (dx, dy) in enumerate(offsets[agent.orient]):
         nx, ny = agent.x + dx, agent.y + dy
-        if not (0 <= nx < ROWS and 0 <= ny < COLS):
+        if not world.in_bounds(nx, ny):
             val = 'P'
         elif grid[nx][ny] == -1:
             val = 'P'
@@ -234,6 +607,73 @@ def sense(grid, agent):
         else: right = val
     return (piso, left, center, right, contact)
 
+# --- Entorno mutable ---
+class Environment:
+    """Envuelve un World para modificar su mapa en tiempo de ejecución.
+
+    Guarda en caché la percepción de cada (fila, columna, orientación). Como una
+    percepción solo lee la celda propia y sus vecinas, al modificar una celda se
+    invalidan únicamente las entradas de su vecindario 3x3. Las celdas cambiadas
+    quedan registradas para que el fondo se repinte de forma incremental.
+    """
+
+    def __init__(self, world, agent=None):
+        self.world = world
+        self.grid = world.grid
+        self.agent = agent  # Si se indica, no se permite poner una pared en su celda
+        self.percept_cache = {}  # (x, y, orient) -> (piso, izq, cen, der)
+        self.changed_cells = set()
+
+    def sense(self, agent):
+        key = (agent.x, agent.y, agent.orient)
+        cached = self.percept_cache.get(key)
+        if cached is None:
+            cached = sense(self.world, agent)[:4]
+            self.percept_cache[key] = cached
+        return cached + (agent.contact,)
+
+    def set_cell(self, r, c, value):
+        """Cambia una celda interior (0=blanco, 1=línea, -1=pared) e invalida su vecindario"""
+        if not (1 <= r < len(self.grid) - 1 and 1 <= c < len(self.grid[0]) - 1):
+            raise ValueError(f"La celda ({r}, {c}) es parte del borde o está fuera del mapa")
+        if value not in (-1, 0, 1):
+            raise ValueError(f"Valor de celda no válido: {value}")
+        if value == -1 and self.agent is not None and (r, c) == (self.agent.x, self.agent.y):
+            raise ValueError(f"No se puede poner una pared en la celda del agente ({r}, {c})")
+        if self.grid[r][c] == value:
+            return
+        self.world.set_cell(r, c, value)
+        self.changed_cells.add((r, c))
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                for orient in ('N', 'E', 'S', 'W'):
+                    self.percept_cache.pop((r + dr, c + dc, orient), None)
+
+    def paint_line(self, r, c):
+        self.set_cell(r, c, 1)
+
+    def erase_line(self, r, c):
+        self.set_cell(r, c, 0)
+
+    def add_wall(self, r, c):
+        self.set_cell(r, c, -1)
+
+    def remove_wall(self, r, c):
+        self.set_cell(r, c, 0)
+
+    def move_wall(self, src, dst):
+        """Mueve una pared de src a dst; la celda origen queda en blanco"""
+        if self.grid[src[0]][src[1]] != -1:
+            raise ValueError(f"No hay pared en {src}")
+        if tuple(src) == tuple(dst):
+            return
+        self.add_wall(*dst)
+        self.remove_wall(*src)
+
+    def pop_changed(self):
+        changed, self.changed_cells = self.changed_cells, set()
+        return changed
+
 def decide(percep, tabla, indices):
     if percep in tabla:
         return tabla[percep], percep, indices[percep]
@@ -241,49 +681,87 @@ def decide(percep, tabla, indices):
     return ['ROTAR+90', 'AVANZAR'], percep, None
 
 # --- Ejecutar acción ---
-def ejecutar(agent, grid, accion):
+def ejecutar(agent, world, accion):
     if accion == 'AVANZAR':
-        agent.forward(grid)
+        agent.forward(world)
     elif accion == 'ROTAR+90':
         agent.rotate(-1)
     elif accion == 'ROTAR-90':
         agent.rotate(+1)
 
 # --- Dibujar ---
-def draw(screen, grid, agent, percep, acciones, iteracion, regla_idx=None, mode="step_by_step"):
+def draw_cell(screen, world, r, c):
+    cell_size = world.cell_size
+    val = world.grid[r][c]
+    if val == -1:
+        # Dibujar pared con efecto de rayas
+        pygame.draw.rect(screen, GRAY, (c*cell_size, r*cell_size, cell_size, cell_size))
+        
+        # Dibujar rayas horizontales
+        stripe_height = 3
+        stripe_spacing = 6
+        y_offset = 0
+        
+        while y_offset < cell_size:
+            # Raya negra
+            pygame.draw.rect(screen, BLACK, 
+                          (c*cell_size, r*cell_size + y_offset, cell_size, stripe_height))
+            y_offset += stripe_height + stripe_spacing
+            
+    elif val == 1:
+        pygame.draw.rect(screen, BLACK, (c*cell_size, r*cell_size, cell_size, cell_size))
+    else:
+        pygame.draw.rect(screen, WHITE, (c*cell_size, r*cell_size, cell_size, cell_size))
+
+class MapBackground:
+    """Superficie con el mapa ya dibujado; solo se repintan las celdas modificadas"""
+
+    def __init__(self, env):
+        self.env = env
+        world = env.world
+        self.surface = pygame.Surface((world.cols * world.cell_size, world.rows * world.cell_size))
+        for r in range(world.rows):
+            for c in range(world.cols):
+                draw_cell(self.surface, world, r, c)
+        env.pop_changed()
+
+    def update(self, cells=None):
+        """Repinta `cells`; sin argumento, las celdas pendientes del entorno"""
+        for r, c in self.env.pop_changed() if cells is None else cells:
+            draw_cell(self.surface, self.env.world, r, c)
+
+PANEL_WIDTH = 400  # Ancho del panel informativo a la derecha del mapa
+MAX_SCREEN_SIZE = (1920, 1080)
+
+def fit_cell_size(rows, cols, cell_size=CELL_SIZE):
+    """Tamaño de celda para que mapa y panel quepan en MAX_SCREEN_SIZE; devuelve (celda, (ancho, alto))"""
+    max_width, max_height = MAX_SCREEN_SIZE
+    if cols * cell_size + PANEL_WIDTH > max_width:
+        cell_size = (max_width - PANEL_WIDTH) // cols
+    if rows * cell_size > max_height:
+        cell_size = max_height // rows
+    cell_size = max(1, cell_size)
+    return cell_size, (cols * cell_size + PANEL_WIDTH, rows * cell_size)
+
+def draw(screen, world, agent, percep, acciones, iteracion, regla_idx=None, mode="step_by_step", background=None):
+    cell_size = world.cell_size
     screen.fill(WHITE)
 
     # Dibujar mapa
-    for r in range(ROWS):
-        for c in range(COLS):
-            val = grid[r][c]
-            if val == -1:
-                # Dibujar pared con efecto de rayas
-                pygame.draw.rect(screen, GRAY, (c*CELL_SIZE, r*CELL_SIZE, CELL_SIZE, CELL_SIZE))
-                
-                # Dibujar rayas horizontales
-                stripe_height = 3
-                stripe_spacing = 6
-                y_offset = 0
-                
-                while y_offset < CELL_SIZE:
-                    # Raya negra
-                    pygame.draw.rect(screen, BLACK, 
-                                  (c*CELL_SIZE, r*CELL_SIZE + y_offset, CELL_SIZE, stripe_height))
-                    y_offset += stripe_height + stripe_spacing
-                    
-            elif val == 1:
-                pygame.draw.rect(screen, BLACK, (c*CELL_SIZE, r*CELL_SIZE, CELL_SIZE, CELL_SIZE))
-            else:
-                pygame.draw.rect(screen, WHITE, (c*CELL_SIZE, r*CELL_SIZE, CELL_SIZE, CELL_SIZE))
+    if background is not None:
+        screen.blit(background.surface, (0, 0))
+    else:
+        for r in range(world.rows):
+            for c in range(world.cols):
+                draw_cell(screen, world, r, c)
 
     # Dibujar agente (círculo + flecha orientación)
-    cx = agent.y * CELL_SIZE + CELL_SIZE // 2
-    cy = agent.x * CELL_SIZE + CELL_SIZE // 2
-    pygame.draw.circle(screen, RED, (cx, cy), CELL_SIZE // 3)
+    cx = agent.y * cell_size + cell_size // 2
+    cy = agent.x * cell_size + cell_size // 2
+    pygame.draw.circle(screen, RED, (cx, cy), cell_size // 3)
 
     # Flecha que indica orientación
-    arrow_len = CELL_SIZE // 2
+    arrow_len = cell_size // 2
     if agent.orient == 'N':
         pygame.draw.polygon(screen, BLUE, [(cx, cy - arrow_len//2), (cx-8, cy-2), (cx+8, cy-2)])
     elif agent.orient == 'E':
@@ -295,7 +773,7 @@ def draw(screen, grid, agent, percep, acciones, iteracion, regla_idx=None, mode=
 
     # Panel informativo más grande
     font = pygame.font.SysFont("consolas", 20)
-    panel_x = COLS * CELL_SIZE + 20
+    panel_x = world.cols * cell_size + 20
     
     # Determinar texto del modo
     if mode == "automatic":
@@ -307,8 +785,8 @@ def draw(screen, grid, agent, percep, acciones, iteracion, regla_idx=None, mode=
     
     lines = [
         f"MODO: {mode_text}",
-        f"MAPA: {ROWS}x{COLS}",
-        f"TABLA: {FILE_NAME}",
+        f"MAPA: {world.rows}x{world.cols}",
+        f"TABLA: {world.table_name}",
         f"ITERACIÓN: {iteracion}",
         f"Posición: ({agent.x}, {agent.y})",
         f"Orientación: {agent.orient} {get_direction_arrow(agent.orient)}",
@@ -325,6 +803,7 @@ def draw(screen, grid, agent, percep, acciones, iteracion, regla_idx=None, mode=
         "• F1: Modo automático normal",
         "• F2: Modo paso a paso",
         "• F3: Modo automático rápido",
+        "• Click izq/der: Línea/Pared",
         "• ESC: Menú de salida",
         "",
         "Archivo CSV: Guardado automático"
@@ -520,19 +999,292 @@ def show_custom_size_menu(screen):
         
         pygame.display.flip()
 
-# --- Función para guardar archivo CSV al final ---
-def save_csv_data(csv_data, output_path):
-    """Guarda todos los datos del CSV al final"""
-    try:
-        with open(output_path, "w", newline='', encoding='utf-8') as logfile:
-            writer = csv.writer(logfile)
-            writer.writerows(csv_data)
-        print(f"Archivo guardado: {output_path}")
-        print(f"Total de iteraciones registradas: {len(csv_data) - 1}")  # -1 por el encabezado
+# --- Fila del archivo de salida ---
+def trace_row(iteracion, pos_inicial, orient_inicial, percep, regla_idx, acciones, pos_final, orient_final):
+    """Construye una fila del CSV de salida a partir del estado antes y después de aplicar la regla"""
+    piso, izq, cen, der, contacto = percep
+    return [
+        iteracion,
+        f"[{pos_inicial[0]},{pos_inicial[1]}]",
+        ORIENT_SYMBOLS[orient_inicial],
+        piso,
+        izq,
+        cen,
+        der,
+        contacto,
+        f"#{regla_idx if regla_idx else '-'}",
+        " y ".join(acciones),
+        f"[{pos_final[0]},{pos_final[1]}]",
+        ORIENT_SYMBOLS[orient_final]
+    ]
+
+# --- Motor de simulación con traza en disco y checkpoints ---
+CHECKPOINT_INTERVAL = 5.0  # Segundos entre checkpoints automáticos en run_simulation
+CHECKPOINT_VERSION = 1
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def new_output_path(compressed=False):
+    """salida/salida-<fecha>.csv, o .trz para la traza comprimida"""
+    timestamp = datetime.now().strftime("%d%m%Y-%H%M%S")
+    return os.path.join("salida", f"salida-{timestamp}.{'trz' if compressed else 'csv'}")
+
+def checkpoint_path_for(output_path):
+    """salida/salida-X.csv -> salida/salida-X.ckpt"""
+    return os.path.splitext(output_path)[0] + ".ckpt"
+
+def load_checkpoint(path):
+    with open(path, "rb") as f:
+        state = pickle.load(f)
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Versión de checkpoint no soportada en {path}")
+    return state
+
+class Simulation:
+    """Avance regla a regla de run_simulation, con la traza escrita en disco a medida que crece.
+
+    checkpoint() guarda de forma atómica todo lo necesario para continuar (mapa,
+    RNG, agente, iteración, tabla y posición en el archivo de traza); resume()
+    trunca la traza a esa posición y sigue exactamente igual que si no se
+    hubiera interrumpido. El costo depende del tamaño del mapa, no de cuántos
+    pasos lleva la simulación.
+    """
+
+    def __init__(self, world, agent, output_path, iteracion=0, trace_offset=None, mode="automatic",
+                 compressed=False):
+        self.world = world
+        self.env = Environment(world, agent)
+        self.agent = agent
+        self.iteracion = iteracion
+        self.mode = mode
+        self.output_path = output_path
+        self.checkpoint_path = checkpoint_path_for(output_path)
+        self.table_hash = file_hash(os.path.join(TABLES_FOLDER, world.table_name))
+        self.compressed = compressed
+        if trace_offset is not None:
+            # Descartar las filas escritas después del checkpoint
+            with open(output_path, "r+b") as f:
+                f.truncate(trace_offset)
+        if compressed:
+            from traza_comprimida import CompressedTraceWriter
+            if trace_offset is None:
+                self._writer = CompressedTraceWriter.create(output_path, CSV_HEADER, iteracion + 1)
+            else:
+                self._writer = CompressedTraceWriter.reopen(output_path)
+            self._trace = self._writer.file
+        elif trace_offset is None:
+            self._trace = open(output_path, "w", newline='', encoding='utf-8')
+            self._writer = csv.writer(self._trace)
+            self._writer.writerow(CSV_HEADER)
+        else:
+            self._trace = open(output_path, "a", newline='', encoding='utf-8')
+            self._writer = csv.writer(self._trace)
+        self.decide_next()
+
+    @classmethod
+    def resume(cls, state, cell_size=CELL_SIZE):
+        """Reconstruye la simulación desde un checkpoint de load_checkpoint()"""
+        table_name = state["tabla"]
+        if file_hash(os.path.join(TABLES_FOLDER, table_name)) != state["tabla_hash"]:
+            raise ValueError(f"La tabla {table_name} cambió desde el checkpoint")
+        tabla, rule_indices = get_table_index().compiled(table_name)
+        world = World.from_state(state["mundo"], table_name, cell_size, tabla, rule_indices)
+        x, y, orient, contact = state["agente"]
+        agent = Agent(world, x, y, orient)
+        agent.contact = contact
+        return cls(world, agent, state["traza"], state["iteracion"], state["traza_offset"], state["modo"],
+                   state.get("comprimida", False))
+
+    def decide_next(self):
+        """Percibe y elige la regla del siguiente paso (también después de editar el mapa)"""
+        percep = self.env.sense(self.agent)
+        self.acciones, self.percep, self.regla_idx = decide(percep, self.world.tabla, self.world.rule_indices)
+
+    def step(self, on_action=None):
+        """Ejecuta todas las acciones de la regla actual, registra la fila y prepara la siguiente"""
+        # Copia por seguridad (por si acciones es una lista reutilizada)
+        acciones = list(self.acciones)
+        self.iteracion += 1
+        agent = self.agent
+        pos_inicial, orient_inicial = (agent.x, agent.y), agent.orient
+        for a in acciones:
+            ejecutar(agent, self.world, a)
+            if on_action is not None:
+                on_action(a)
+        self._writer.writerow(trace_row(self.iteracion, pos_inicial, orient_inicial, self.percep, self.regla_idx,
+                                        acciones, (agent.x, agent.y), agent.orient))
+        self.decide_next()
+
+    def checkpoint(self):
+        """Escribe el checkpoint de forma atómica; la traza se sincroniza antes para que nunca quede corta"""
+        if self.compressed:
+            self._writer.flush_pending()
+        self._trace.flush()
+        os.fsync(self._trace.fileno())
+        agent = self.agent
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "tabla": self.world.table_name,
+            "tabla_hash": self.table_hash,
+            "mundo": self.world.get_state(),
+            "agente": (agent.x, agent.y, agent.orient, agent.contact),
+            "iteracion": self.iteracion,
+            "modo": self.mode,
+            "traza": self.output_path,
+            "traza_offset": self._trace.tell(),
+            "comprimida": self.compressed,
+        }
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def close(self):
+        """Deja un último checkpoint y cierra la traza"""
+        try:
+            self.checkpoint()
+            self._trace.close()
+            print(f"Archivo guardado: {self.output_path}")
+            print(f"Total de iteraciones registradas: {self.iteracion}")
+            return True
+        except Exception as e:
+            print(f"Error al guardar archivo: {e}")
+            return False
+
+# --- Simulación en un hilo aparte ---
+AUTO_STEP_INTERVALS = {"automatic": 200, "automatic_fast": 50}  # Milisegundos entre pasos automáticos
+
+# Estado inmutable que se dibuja; tiene x, y y orient, así que draw() lo acepta como agente
+Snapshot = namedtuple("Snapshot", "x y orient contact percep acciones regla_idx iteracion")
+
+class SnapshotBuffer:
+    """Doble buffer de instantáneas: el hilo de simulación escribe en un espacio mientras la UI lee el otro.
+
+    Las celdas modificadas se acumulan hasta que la UI las recoge, así que no se
+    pierden aunque la UI se salte instantáneas intermedias.
+    """
+
+    def __init__(self):
+        self._slots = [None, None]
+        self._front = 0
+        self._cells = set()
+        self._lock = threading.Lock()
+
+    def publish(self, snapshot, cells):
+        with self._lock:
+            back = 1 - self._front
+            self._slots[back] = snapshot
+            self._front = back
+            self._cells |= cells
+
+    def take(self):
+        """Última instantánea y celdas cambiadas desde la llamada anterior"""
+        with self._lock:
+            cells, self._cells = self._cells, set()
+            return self._slots[self._front], cells
+
+class SimulationWorker(threading.Thread):
+    """Avanza una Simulation a su propio ritmo y recibe los cambios de modo y ediciones como comandos.
+
+    Es el único hilo que toca la simulación mientras está vivo: la UI solo envía
+    comandos con send() y dibuja la última instantánea de `snapshots`.
+    """
+
+    def __init__(self, sim, mode):
+        super().__init__(daemon=True)
+        self.sim = sim
+        self.mode = mode
+        self.commands = queue.Queue()
+        self.snapshots = SnapshotBuffer()
+        self.error = None
+        self._paused = False
+        self._step_ready = False
+        self._publish()
+
+    def send(self, *command):
+        self.commands.put(command)
+
+    def stop(self):
+        """Detiene el hilo y espera a que termine; después la simulación vuelve a ser de quien llama"""
+        self.send("detener")
+        self.join()
+
+    def _publish(self, percep=None, acciones=None):
+        sim, agent = self.sim, self.sim.agent
+        snapshot = Snapshot(agent.x, agent.y, agent.orient, agent.contact,
+                            percep if percep is not None else sim.percep,
+                            tuple(acciones if acciones is not None else sim.acciones),
+                            sim.regla_idx, sim.iteracion)
+        self.snapshots.publish(snapshot, self.sim.env.pop_changed())
+
+    def _publish_action(self, accion):
+        # Estado intermedio después de cada acción de la regla
+        self._publish(self.sim.env.sense(self.sim.agent), [accion])
+
+    def _handle(self, command):
+        """Aplica un comando de la UI; devuelve False si hay que detenerse"""
+        name, *args = command
+        if name == "detener":
+            return False
+        if name == "modo":
+            self.mode = self.sim.mode = args[0]
+            self._step_ready = False
+            self._next_step = time.monotonic() + AUTO_STEP_INTERVALS.get(self.mode, 0) / 1000
+        elif name == "paso":
+            self._step_ready = self.mode == "step_by_step"
+        elif name == "pausa":
+            self._paused = args[0]
+        elif name == "editar":
+            # Click izquierdo pinta/borra línea, click derecho pone/quita pared
+            r, c, button = args
+            grid, agent = self.sim.world.grid, self.sim.agent
+            if (r, c) != (agent.x, agent.y):
+                if button == 1:
+                    self.sim.env.set_cell(r, c, 0 if grid[r][c] == 1 else 1)
+                else:
+                    self.sim.env.set_cell(r, c, 0 if grid[r][c] == -1 else -1)
+                self.sim.decide_next()
+                self._publish()
         return True
-    except Exception as e:
-        print(f"Error al guardar archivo: {e}")
-        return False
+
+    def run(self):
+        try:
+            self._next_step = time.monotonic() + AUTO_STEP_INTERVALS.get(self.mode, 0) / 1000
+            last_checkpoint = time.monotonic()
+            while True:
+                # Esperar comandos hasta que toque el siguiente paso (o indefinidamente en pausa)
+                automatic = self.mode in AUTO_STEP_INTERVALS and not self._paused
+                if self._step_ready and not self._paused:
+                    timeout = 0
+                elif automatic:
+                    timeout = max(0.0, self._next_step - time.monotonic())
+                else:
+                    timeout = max(0.0, last_checkpoint + CHECKPOINT_INTERVAL - time.monotonic())
+                try:
+                    if not self._handle(self.commands.get(timeout=timeout)):
+                        break
+                    while True:
+                        if not self._handle(self.commands.get_nowait()):
+                            return
+                except queue.Empty:
+                    pass
+
+                now = time.monotonic()
+                if not self._paused and (self._step_ready or (automatic and now >= self._next_step)):
+                    self.sim.step(self._publish_action)
+                    self._publish()
+                    self._step_ready = False
+                    self._next_step = now + AUTO_STEP_INTERVALS.get(self.mode, 0) / 1000
+
+                if now - last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self.sim.checkpoint()
+                    last_checkpoint = now
+        except BaseException as e:
+            self.error = e
 
 # --- Mostrar menú de salida ---
 def show_exit_menu(screen):
@@ -706,7 +1458,7 @@ def show_mode_menu(screen):
                     return "automatic_fast"
 
 # --- Programa principal ---
-def main():
+def main(compressed=False):
     pygame.init()
     
     # Mostrar menú de selección de tabla primero
@@ -725,39 +1477,26 @@ def main():
         return
     
     # Llamar a la función de simulación con la tabla seleccionada
-    run_simulation(map_size, selected_table)
+    run_simulation(map_size, selected_table, compressed=compressed)
 
 # --- Función de simulación ---
-def run_simulation(map_size, selected_table):
-    
-    # Configurar dimensiones globales
-    global ROWS, COLS, CELL_SIZE, FILE_NAME
-    ROWS, COLS = map_size
-    FILE_NAME = selected_table
-    
-    # Crear ventana principal con el tamaño correcto
-    panel_width = 400
-    screen_width = (COLS * CELL_SIZE) + panel_width
-    screen_height = ROWS * CELL_SIZE
-    
-    # Ajustar tamaño de ventana si es muy grande
-    max_width, max_height = 1920, 1080
-    if screen_width > max_width:
-        CELL_SIZE = (max_width - panel_width) // COLS
-        screen_width = (COLS * CELL_SIZE) + panel_width
-        screen_height = ROWS * CELL_SIZE
+def run_simulation(map_size, selected_table, checkpoint=None, compressed=False):
+    """Abre la ventana de simulación; con `checkpoint` (de load_checkpoint) continúa una ejecución guardada.
+
+    Con `compressed` la traza se escribe en formato comprimido (.trz, ver traza_comprimida.py).
+    """
+    # Dimensiones de esta simulación (no se modifican los valores por defecto)
+    rows, cols = map_size
     
-    if screen_height > max_height:
-        CELL_SIZE = max_height // ROWS
-        screen_width = (COLS * CELL_SIZE) + panel_width
-        screen_height = ROWS * CELL_SIZE
+    # Crear ventana principal con el tamaño correcto (celdas más chicas si el mapa no entra)
+    cell_size, (screen_width, screen_height) = fit_cell_size(rows, cols)
     
     screen = pygame.display.set_mode((screen_width, screen_height))
     pygame.display.set_caption("Agente reflejo simple")
     clock = pygame.time.Clock()
     
-    # Mostrar menú de selección de modo
-    mode = show_mode_menu(screen)
+    # Mostrar menú de selección de modo (al reanudar se usa el modo guardado)
+    mode = checkpoint["modo"] if checkpoint is not None else show_mode_menu(screen)
     if mode is None:
         pygame.quit()
         return
@@ -770,118 +1509,78 @@ def run_simulation(map_size, selected_table):
     else:
         pygame.display.set_caption("Agente reflejo simple - Modo PASO A PASO (ENTER/F1/F2/F3)")
 
-    grid = create_map(ROWS, COLS, density=DENSITY)
-    tabla, rule_indices = load_table(FILE_NAME)
-    agent = Agent(grid)
-    iteracion = 0
-
-    # Percepción inicial
-    percep = sense(grid, agent)
-    acciones, percep_actual, regla_idx = decide(percep, tabla, rule_indices)
-
-    running = True
-    step_ready = False  # bandera: solo avanza al presionar ENTER
-    auto_step_timer = pygame.time.get_ticks()  # timer para modo automático - inicializar con tiempo actual
-    # Configurar velocidad inicial según el modo seleccionado
-    if mode == "automatic_fast":
-        AUTO_STEP_INTERVAL = 50  # milisegundos entre pasos automáticos (súper rápido)
-    else:
-        AUTO_STEP_INTERVAL = 200  # milisegundos entre pasos automáticos (normal)
-
-    # --- Crear carpeta y archivo CSV de salida ---
+    # --- Crear carpeta y archivo CSV de salida (al reanudar se sigue escribiendo el mismo) ---
     os.makedirs("salida", exist_ok=True)
-    timestamp = datetime.now().strftime("%d%m%Y-%H%M%S")
-    output_path = os.path.join("salida", f"salida-{timestamp}.csv")
-
-    # Preparar datos para guardar al final
-    csv_data = []
-    csv_data.append([
-        "#",
-        "Pos",
-        "Orientación",
-        "Piso",
-        "Izquierda",
-        "Centro",
-        "Derecha",
-        "Contacto",
-        "Regla",
-        "Acción",
-        "Nueva Pos",
-        "Nueva Orientación"
-    ])
+    if checkpoint is not None:
+        sim = Simulation.resume(checkpoint, cell_size)
+        world = sim.world
+        compressed = sim.compressed
+    else:
+        output_path = new_output_path(compressed)
+        # La tabla ya está compilada en el índice: no se vuelve a parsear el CSV
+        tabla, rule_indices = get_table_index().compiled(selected_table)
+        world = World.generate(rows, cols, density=DENSITY, table_name=selected_table, cell_size=cell_size,
+                               tabla=tabla, rule_indices=rule_indices)
+        # La traza se escribe en disco a medida que avanza y se guarda un checkpoint cada pocos segundos
+        sim = Simulation(world, Agent(world), output_path, mode=mode, compressed=compressed)
+    env = sim.env
+    background = MapBackground(env)
+    # La simulación avanza en su propio hilo; este bucle solo atiende eventos y dibuja la última instantánea
+    worker = SimulationWorker(sim, mode)
+    worker.start()
 
+    running = True
     while running:
-        current_time = pygame.time.get_ticks()
-        
         # Procesar eventos de forma no bloqueante
         for ev in pygame.event.get():
             if ev.type == pygame.QUIT:
-                # Guardar archivo antes de cerrar
-                save_csv_data(csv_data, output_path)
                 running = False
+            elif ev.type == pygame.MOUSEBUTTONDOWN and ev.button in (1, 3):
+                # Edición del mapa: click izquierdo pinta/borra línea, click derecho pone/quita pared
+                r, c = ev.pos[1] // cell_size, ev.pos[0] // cell_size
+                if 1 <= r < rows - 1 and 1 <= c < cols - 1:
+                    worker.send("editar", r, c, ev.button)
             elif ev.type == pygame.KEYDOWN:
                 if ev.key == pygame.K_RETURN and mode == "step_by_step":  # ENTER solo en modo paso a paso
-                    step_ready = True
+                    worker.send("paso")
                 elif ev.key == pygame.K_F1:  # Cambiar a modo automático
                     mode = "automatic"
-                    AUTO_STEP_INTERVAL = 200  # Velocidad normal
+                    worker.send("modo", mode)
                     pygame.display.set_caption("Agente reflejo simple - Modo AUTOMÁTICO (F1/F2/F3 para cambiar)")
-                    auto_step_timer = current_time  # Reset timer
                 elif ev.key == pygame.K_F2:  # Cambiar a modo paso a paso
                     mode = "step_by_step"
+                    worker.send("modo", mode)
                     pygame.display.set_caption("Agente reflejo simple - Modo PASO A PASO (ENTER/F1/F2/F3)")
-                    step_ready = False
                 elif ev.key == pygame.K_F3:  # Modo automático súper rápido
                     mode = "automatic_fast"
-                    AUTO_STEP_INTERVAL = 50  # Velocidad súper rápida
+                    worker.send("modo", mode)
                     pygame.display.set_caption("Agente reflejo simple - Modo AUTOMÁTICO RÁPIDO (F1/F2/F3 para cambiar)")
-                    auto_step_timer = current_time  # Reset timer
                 elif ev.key == pygame.K_ESCAPE:
-                    # Mostrar menú de salida
+                    # Mostrar menú de salida con la simulación en pausa
+                    worker.send("pausa", True)
                     exit_choice = show_exit_menu(screen)
+                    if exit_choice in ("restart", "main_menu", "mode_menu"):
+                        # Detener el hilo y guardar el archivo actual
+                        worker.stop()
+                        sim.close()
                     if exit_choice == "restart":
-                        # Guardar archivo actual antes de reiniciar
-                        save_csv_data(csv_data, output_path)
-                        
-                        # Crear nuevo archivo para el nuevo recorrido
-                        timestamp = datetime.now().strftime("%d%m%Y-%H%M%S")
-                        output_path = os.path.join("salida", f"salida-{timestamp}.csv")
-                        csv_data = []
-                        csv_data.append([
-                            "#", "Pos", "Orientación", "Piso", "Izquierda", "Centro", 
-                            "Derecha", "Contacto", "Regla", "Acción", "Nueva Pos", "Nueva Orientación"
-                        ])
-                        
-                        # Reiniciar agente en la misma posición
-                        agent = Agent(grid)
-                        iteracion = 0
-                        percep = sense(grid, agent)
-                        acciones, percep_actual, regla_idx = decide(percep, tabla, rule_indices)
-                        step_ready = False
-                        auto_step_timer = pygame.time.get_ticks()
+                        # Crear nuevo archivo para el nuevo recorrido y reiniciar el agente
+                        sim = Simulation(world, Agent(world), new_output_path(compressed), mode=mode,
+                                         compressed=compressed)
+                        env = sim.env
+                        background = MapBackground(env)
+                        worker = SimulationWorker(sim, mode)
+                        worker.start()
                     elif exit_choice == "main_menu":
-                            # Guardar archivo antes de salir
-                            save_csv_data(csv_data, output_path)
                             pygame.quit()
-                            restart_main()
+                            restart_main(compressed)
                             return
                     elif exit_choice == "mode_menu":
-                        # Guardar archivo antes de cambiar modo
-                        save_csv_data(csv_data, output_path)
-                        
-                        # Crear nuevo archivo para el nuevo modo
-                        timestamp = datetime.now().strftime("%d%m%Y-%H%M%S")
-                        output_path = os.path.join("salida", f"salida-{timestamp}.csv")
-                        csv_data = []
-                        csv_data.append([
-                            "#", "Pos", "Orientación", "Piso", "Izquierda", "Centro", 
-                            "Derecha", "Contacto", "Regla", "Acción", "Nueva Pos", "Nueva Orientación"
-                        ])
-                        
                         # Volver al menú de modo
                         mode = show_mode_menu(screen)
                         if mode is None:
                             running = False
+                            sim = None
                         else:
                             # Configurar título según el modo
                             if mode == "automatic":
@@ -891,102 +1590,62 @@ def run_simulation(map_size, selected_table):
                             else:
                                 pygame.display.set_caption("Agente reflejo simple - Modo PASO A PASO (ENTER/F1/F2/F3)")
                             
-                            # Configurar velocidad inicial según el modo seleccionado
-                            if mode == "automatic_fast":
-                                AUTO_STEP_INTERVAL = 50
-                            else:
-                                AUTO_STEP_INTERVAL = 200
-                            
-                            # Reiniciar agente
-                            agent = Agent(grid)
-                            iteracion = 0
-                            percep = sense(grid, agent)
-                            acciones, percep_actual, regla_idx = decide(percep, tabla, rule_indices)
-                            step_ready = False
-                            auto_step_timer = pygame.time.get_ticks()
+                            # Crear nuevo archivo para el nuevo modo y reiniciar el agente
+                            sim = Simulation(world, Agent(world), new_output_path(compressed), mode=mode,
+                                             compressed=compressed)
+                            env = sim.env
+                            background = MapBackground(env)
+                            worker = SimulationWorker(sim, mode)
+                            worker.start()
                     elif exit_choice == "exit":
-                        # Guardar archivo antes de salir completamente
-                        save_csv_data(csv_data, output_path)
                         running = False
+                    else:
                         # Si es "cancel", continúa la ejecución normal
+                        worker.send("pausa", False)
 
-        # --- Lógica de avance según el modo ---
-        should_step = False
-        
-        if mode == "step_by_step":
-            should_step = step_ready
-        elif mode in ["automatic", "automatic_fast"]:
-            # En modo automático, avanzar cada AUTO_STEP_INTERVAL milisegundos
-            if current_time - auto_step_timer >= AUTO_STEP_INTERVAL:
-                should_step = True
-                auto_step_timer = current_time
-            
-        if should_step:
-            # Copia por seguridad (por si acciones es una lista reutilizada)
-            acciones_a_ejecutar = list(acciones)
-            iteracion += 1
-
-            # Guardar estado inicial (antes de ejecutar las acciones)
-            pos_inicial = (agent.x, agent.y)
-            orient_inicial = agent.orient
-            orient_symbol_inicial = {'N': '^', 'E': '>', 'S': 'v', 'W': '<'}[orient_inicial]
-            piso_inicial, izq_inicial, cen_inicial, der_inicial, contacto_inicial = percep_actual
-
-            # Ejecuta TODAS las acciones de la regla actual, en orden
-            for a in acciones_a_ejecutar:
-                ejecutar(agent, grid, a)
-                # Actualizar percepción después de cada acción para el display
-                percep_nuevo = sense(grid, agent)
-                draw(screen, grid, agent, percep_nuevo, [a], iteracion, regla_idx, mode)
-                pygame.display.flip()
-
-            # Guardar estado final (después de ejecutar todas las acciones)
-            pos_final = (agent.x, agent.y)
-            orient_final = agent.orient
-            orient_symbol_final = {'N': '^', 'E': '>', 'S': 'v', 'W': '<'}[orient_final]
-
-            # Concatenar todas las acciones con " y "
-            acciones_concatenadas = " y ".join(acciones_a_ejecutar)
-
-            # Agregar datos a la lista en memoria (se guardará al final)
-            csv_data.append([
-                iteracion,
-                f"[{pos_inicial[0]},{pos_inicial[1]}]",
-                orient_symbol_inicial,
-                piso_inicial,
-                izq_inicial,
-                cen_inicial,
-                der_inicial,
-                contacto_inicial,
-                f"#{regla_idx if regla_idx else '-'}",
-                acciones_concatenadas,
-                f"[{pos_final[0]},{pos_final[1]}]",
-                orient_symbol_final
-            ])
-
-            # Al terminar TODAS las acciones de la regla, prepara la siguiente regla
-            percep_actual = sense(grid, agent)
-            # si tu decide devuelve también regla_idx, úsalo aquí:
-            acciones, percep_actual, regla_idx = decide(percep_actual, tabla, rule_indices)
-            #acciones, percep_actual = decide(percep_actual, tabla)
-
-            # Reset step_ready solo en modo paso a paso
-            if mode == "step_by_step":
-                step_ready = False  # espera la siguiente pulsación de ENTER
-
-        # --- Dibuja siempre el estado actual aunque no se mueva ---
-        draw(screen, grid, agent, percep_actual, acciones, iteracion, regla_idx, mode)
+        if sim is None or not running:
+            break
+        if not worker.is_alive():
+            # El hilo de simulación terminó por un error: se guarda lo hecho y se informa
+            sim.close()
+            pygame.quit()
+            raise worker.error
+
+        # --- Dibuja la última instantánea publicada; el ritmo de dibujo no frena la simulación ---
+        snap, cells = worker.snapshots.take()
+        background.update(cells)
+        draw(screen, world, snap, snap.percep, snap.acciones, snap.iteracion, snap.regla_idx, mode, background)
         pygame.display.flip()
         clock.tick(FPS)
 
     # Guardar archivo antes de cerrar el programa
-    save_csv_data(csv_data, output_path)
+    if sim is not None:
+        worker.stop()
+        sim.close()
     pygame.quit()
 
+# --- Reanudar desde un checkpoint ---
+def resume_simulation(checkpoint_path):
+    """Continúa una simulación guardada en salida/salida-*.ckpt con su tabla, mapa y modo"""
+    checkpoint = load_checkpoint(checkpoint_path)
+    pygame.init()
+    mundo = checkpoint["mundo"]
+    run_simulation((mundo["filas"], mundo["columnas"]), checkpoint["tabla"], checkpoint)
+
 # --- Función recursiva para reiniciar ---
-def restart_main():
+def restart_main(compressed=False):
     pygame.quit()
-    main()
+    main(compressed)
 
 if __name__ == "__main__":
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Agente reflejo simple")
+    parser.add_argument("--reanudar", metavar="CHECKPOINT", default=None,
+                        help="Continuar una simulación desde salida/salida-*.ckpt")
+    parser.add_argument("--comprimida", action="store_true",
+                        help="Escribir la traza comprimida por ciclos (salida/salida-*.trz)")
+    args = parser.parse_args()
+    if args.reanudar:
+        resume_simulation(args.reanudar)
+    else:
+        main(args.comprimida)
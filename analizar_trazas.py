@@ -0,0 +1,210 @@
+import os
+import csv
+import glob
+import json
+import argparse
+from itertools import islice
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import agente
+import traza_comprimida
+
+DEFAULT_PATTERNS = (os.path.join("salida", "salida-*.csv"), os.path.join("salida", "salida-*.trz"))
+CHUNK_ROWS = 10_000  # Filas leídas y agregadas de una vez; nunca se carga el archivo entero
+
+# Posición de cada columna en el formato que escribe run_simulation (agente.CSV_HEADER)
+(COL_ITER, COL_POS, COL_ORIENT, COL_PISO, COL_IZQ, COL_CEN, COL_DER,
+ COL_CONTACTO, COL_REGLA, COL_ACCION, COL_NUEVA_POS, COL_NUEVA_ORIENT) = range(len(agente.CSV_HEADER))
+
+# --- Agregados parciales ---
+class TraceStats:
+    """Contadores de una o varias trazas; se combinan con merge() sin releer los archivos.
+
+    Los números de regla solo tienen sentido dentro de una tabla (#31 de una tabla
+    no es #31 de otra), así que las reglas se cuentan por tabla.
+    """
+
+    def __init__(self, tabla=None):
+        self.tabla = tabla
+        self.archivos = 0
+        self.pasos = 0
+        self.contacto = 0
+        self.sobre_linea = 0
+        self.recorrido = 0
+        self.celdas_visitadas = 0
+        self.reglas = {}  # tabla -> Counter de reglas
+        self.acciones = Counter()
+        self.percepciones = Counter()
+
+    def add_chunk(self, rows, visited):
+        """Acumula un bloque de filas; `visited` es el conjunto de celdas del archivo en curso"""
+        self.pasos += len(rows)
+        self.contacto += sum(row[COL_CONTACTO] == '1' for row in rows)
+        self.sobre_linea += sum(row[COL_PISO] == '1' for row in rows)
+        self.reglas.setdefault(self.tabla, Counter()).update(row[COL_REGLA] for row in rows)
+        self.acciones.update(a for row in rows for a in row[COL_ACCION].split(" y ") if a)
+        self.percepciones.update(tuple(row[COL_PISO:COL_CONTACTO + 1]) for row in rows)
+        for row in rows:
+            x0, y0 = _parse_pos(row[COL_POS])
+            x1, y1 = _parse_pos(row[COL_NUEVA_POS])
+            # Celdas avanzadas en el paso: exacto para las secuencias de las tablas actuales
+            self.recorrido += abs(x1 - x0) + abs(y1 - y0)
+            visited.add((x0, y0))
+            visited.add((x1, y1))
+
+    def merge(self, other):
+        self.archivos += other.archivos
+        self.pasos += other.pasos
+        self.contacto += other.contacto
+        self.sobre_linea += other.sobre_linea
+        self.recorrido += other.recorrido
+        self.celdas_visitadas += other.celdas_visitadas
+        for tabla, counts in other.reglas.items():
+            self.reglas.setdefault(tabla, Counter()).update(counts)
+        self.acciones.update(other.acciones)
+        self.percepciones.update(other.percepciones)
+        return self
+
+    def to_dict(self, top=None):
+        steps = self.pasos or 1
+        return {
+            "archivos": self.archivos,
+            "pasos": self.pasos,
+            "contacto": self.contacto / steps,
+            "sobre_linea": self.sobre_linea / steps,
+            "recorrido": self.recorrido,
+            "celdas_visitadas": self.celdas_visitadas,
+            "reglas_distintas": sum(len(counts) for counts in self.reglas.values()),
+            "cobertura_percepciones": len(self.percepciones) / agente.NUM_PERCEPTIONS,
+            "reglas": {tabla: dict(counts.most_common(top)) for tabla, counts in self.reglas.items()},
+            "acciones": dict(self.acciones.most_common(top)),
+            "percepciones": {"".join(p): n for p, n in self.percepciones.most_common(top)},
+        }
+
+def _parse_pos(text):
+    x, y = text.strip("[]").split(",")
+    return int(x), int(y)
+
+# --- Lectura por bloques (se ejecuta en los procesos del pool) ---
+def trace_table(path, default=None):
+    """Tabla con la que se generó una traza, según su checkpoint (salida-X.ckpt); si no hay, `default`"""
+    checkpoint = agente.checkpoint_path_for(path)
+    if os.path.exists(checkpoint):
+        try:
+            return agente.load_checkpoint(checkpoint)["tabla"]
+        except Exception:
+            pass
+    return default or "desconocida"
+
+def _read_rows(path):
+    """Filas de una traza CSV o comprimida (.trz), empezando por la cabecera"""
+    if path.endswith(".trz"):
+        yield from traza_comprimida.decode_rows(path)
+        return
+    with open(path, newline='', encoding='utf-8') as f:
+        yield from csv.reader(f)
+
+def analyze_file(path, chunk_rows=CHUNK_ROWS, default_table=None):
+    """Recorre una traza por bloques de `chunk_rows` filas y devuelve (ruta, TraceStats o error)"""
+    stats = TraceStats(trace_table(path, default_table))
+    visited = set()
+    try:
+        reader = _read_rows(path)
+        header = next(reader, None)
+        if header != agente.CSV_HEADER:
+            raise ValueError("la cabecera no coincide con agente.CSV_HEADER")
+        while True:
+            rows = list(islice(reader, chunk_rows))
+            if not rows:
+                break
+            stats.add_chunk(rows, visited)
+    except (OSError, ValueError, IndexError, csv.Error) as e:
+        return path, f"{type(e).__name__}: {e}"
+    stats.archivos = 1
+    stats.celdas_visitadas = len(visited)
+    return path, stats
+
+def analyze(paths, workers=None, chunk_rows=CHUNK_ROWS, default_table=None):
+    """Analiza las trazas en paralelo; devuelve (estadísticas por archivo, global, errores).
+
+    `default_table` es la tabla que se asume para las trazas sin checkpoint.
+    """
+    per_file = {}
+    errors = {}
+    total = TraceStats()
+    workers = workers or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for path, result in pool.map(analyze_file, paths, [chunk_rows] * len(paths), [default_table] * len(paths),
+                                     chunksize=chunksize):
+            if isinstance(result, str):
+                errors[path] = result
+                continue
+            per_file[path] = result
+            total.merge(result)
+    return per_file, total, errors
+
+# --- Reporte ---
+def print_report(per_file, total, errors, top):
+    if per_file:
+        print(f"{'Archivo':<34}{'Pasos':>9}{'Contacto':>10}{'Línea':>8}{'Recorrido':>11}{'Celdas':>8}{'Reglas':>8}{'Percep.':>9}  Tabla")
+        for path, stats in per_file.items():
+            d = stats.to_dict()
+            print(f"{os.path.basename(path):<34}{d['pasos']:>9}{d['contacto']:>10.1%}{d['sobre_linea']:>8.1%}"
+                  f"{d['recorrido']:>11}{d['celdas_visitadas']:>8}{d['reglas_distintas']:>8}"
+                  f"{d['cobertura_percepciones']:>9.1%}  {stats.tabla}")
+        print()
+
+    d = total.to_dict(top)
+    steps = total.pasos or 1
+    print(f"Global: {d['archivos']} archivos, {d['pasos']} pasos")
+    print(f"  Pasos con contacto=1:   {d['contacto']:.2%}")
+    print(f"  Pasos sobre línea:      {d['sobre_linea']:.2%}")
+    print(f"  Recorrido total:        {d['recorrido']} celdas ({d['recorrido'] / steps:.3f} por paso)")
+    print(f"  Celdas visitadas/arch.: {d['celdas_visitadas'] / max(1, d['archivos']):.1f}")
+    print(f"  Percepciones vistas:    {len(total.percepciones)} de {agente.NUM_PERCEPTIONS}")
+    for tabla, counts in sorted(d["reglas"].items()):
+        # Porcentaje sobre los pasos hechos con esa tabla
+        table_steps = sum(total.reglas[tabla].values()) or 1
+        print(f"  Reglas más frecuentes de {tabla}:")
+        for name, count in counts.items():
+            print(f"    {name:<22}{count:>10}  {count / table_steps:6.2%}")
+    for title, key in (("Acciones", "acciones"), ("Percepciones", "percepciones")):
+        print(f"  {title} más frecuentes:")
+        for name, count in d[key].items():
+            print(f"    {name:<22}{count:>10}  {count / steps:6.2%}")
+
+    for path, error in errors.items():
+        print(f"Omitido {path}: {error}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Estadísticas de las trazas de salida/ leídas por bloques y en paralelo")
+    parser.add_argument("archivos", nargs="*", help=f"Trazas .csv o .trz (por defecto {' y '.join(DEFAULT_PATTERNS)})")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--bloque", type=int, default=CHUNK_ROWS, help="Filas por bloque de lectura")
+    parser.add_argument("--top", type=int, default=10, help="Cuántas reglas, acciones y percepciones listar")
+    parser.add_argument("--tabla", default=None, help="Tabla de las trazas que no tienen checkpoint al lado")
+    parser.add_argument("--json", default=None, help="Guardar también las estadísticas en este archivo JSON")
+    args = parser.parse_args()
+
+    paths = sorted(args.archivos or [path for pattern in DEFAULT_PATTERNS for path in glob.glob(pattern)])
+    if not paths:
+        print(f"No se encontraron trazas ({', '.join(DEFAULT_PATTERNS)})")
+        return
+
+    per_file, total, errors = analyze(paths, args.procesos, args.bloque, args.tabla)
+    print_report(per_file, total, errors, args.top)
+
+    if args.json:
+        report = {
+            "global": total.to_dict(),
+            "archivos": {path: stats.to_dict() for path, stats in per_file.items()},
+            "errores": errors,
+        }
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"Estadísticas guardadas: {args.json}")
+
+if __name__ == "__main__":
+    main()
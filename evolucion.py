@@ -0,0 +1,295 @@
+import os
+import csv
+import json
+import random
+import sqlite3
+import hashlib
+import argparse
+from itertools import product
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import agente
+
+# --- Espacio de búsqueda ---
+# Todas las percepciones posibles en el orden de las columnas de la tabla
+PERCEPTIONS = [
+    (piso, izq, cen, der, contacto)
+    for piso, izq, cen, der, contacto in product('01', 'P.L', 'P.L', 'P.L', '01')
+]
+ACTION_SEQUENCES = [
+    ('AVANZAR',),
+    ('ROTAR+90',),
+    ('ROTAR-90',),
+    ('AVANZAR', 'ROTAR+90'),
+    ('AVANZAR', 'ROTAR-90'),
+    ('ROTAR+90', 'AVANZAR'),
+    ('ROTAR-90', 'AVANZAR'),
+]
+TABLE_HEADER = "# piso (0=blanco 1=línea), izq (P=pared|L=línea|.=blanco), cen, der, contacto (0=no|1=sí), accion1,accion2"
+CACHE_PATH = os.path.join("salida", "evolucion-cache.sqlite")
+
+# --- Representación de las tablas ---
+def genome_to_table(genome):
+    """Convierte un genoma (un índice de ACTION_SEQUENCES por percepción) en (tabla, rule_index)"""
+    table = {}
+    rule_index = {}
+    for line_num, (percep, gene) in enumerate(zip(PERCEPTIONS, genome), start=1):
+        table[percep] = list(ACTION_SEQUENCES[gene])
+        rule_index[percep] = line_num
+    return table, rule_index
+
+def table_to_genome(table, rng):
+    """Convierte una tabla cargada con load_table en genoma; las percepciones ausentes se rellenan al azar"""
+    genome = []
+    for percep in PERCEPTIONS:
+        acciones = tuple(table.get(percep, ()))
+        if acciones in ACTION_SEQUENCES:
+            genome.append(ACTION_SEQUENCES.index(acciones))
+        else:
+            genome.append(rng.randrange(len(ACTION_SEQUENCES)))
+    return tuple(genome)
+
+def table_rows(genome):
+    """Filas CSV de la tabla en el mismo formato que lee load_table"""
+    return [list(percep) + list(ACTION_SEQUENCES[gene]) for percep, gene in zip(PERCEPTIONS, genome)]
+
+def table_hash(genome):
+    text = "\n".join(",".join(row) for row in table_rows(genome))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+# --- Mapas de evaluación ---
+def make_maps(rows, cols, seeds, density=agente.DENSITY):
+    """Genera un mundo y una posición inicial reproducibles por cada semilla"""
+    maps = []
+    for seed in seeds:
+        world = agente.World.generate(rows, cols, density=density, seed=seed)
+        agent = agente.Agent(world)
+        maps.append((world, (agent.x, agent.y, agent.orient)))
+    return maps
+
+def map_hash(game_map):
+    world, start = game_map
+    text = json.dumps([world.grid, list(start)])
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+# --- Simulación sin ventana ---
+def simulate(world, start, tabla, rule_indices, steps, free_cells=None):
+    """Ejecuta `steps` reglas y devuelve las métricas del recorrido"""
+    x, y, orient = start
+    agent = agente.Agent(world, x, y, orient)
+    grid = world.grid
+    if free_cells is None:
+        free_cells = world.free_count
+    visited = {(agent.x, agent.y)}
+    on_line = 0
+    contacts = 0
+    for _ in range(steps):
+        percep = agente.sense(world, agent)
+        acciones, _, _ = agente.decide(percep, tabla, rule_indices)
+        for a in acciones:
+            agente.ejecutar(agent, world, a)
+        visited.add((agent.x, agent.y))
+        if grid[agent.x][agent.y] == 1:
+            on_line += 1
+        if agent.contact == '1':
+            contacts += 1
+    return {
+        "linea": on_line / steps if steps else 0.0,
+        "cobertura": len(visited) / free_cells,
+        "contacto": contacts / steps if steps else 0.0,
+    }
+
+# Mapas del proceso trabajador: se envían una sola vez al crear el pool
+_worker_maps = None
+
+def _init_worker(maps):
+    global _worker_maps
+    _worker_maps = maps
+
+def _evaluate_task(task):
+    genome, map_ids, steps = task
+    tabla, rule_indices = genome_to_table(genome)
+    return [simulate(*_worker_maps[i], tabla, rule_indices, steps) for i in map_ids]
+
+# --- Caché de aptitud en disco ---
+class FitnessCache:
+    """Métricas memoizadas por (hash de tabla, hash de mapa, pasos) en SQLite"""
+
+    def __init__(self, path=CACHE_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS fitness ("
+            "table_hash TEXT, map_hash TEXT, steps INTEGER, metrics TEXT, "
+            "PRIMARY KEY (table_hash, map_hash, steps))"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, t_hash, m_hash, steps):
+        row = self.conn.execute(
+            "SELECT metrics FROM fitness WHERE table_hash=? AND map_hash=? AND steps=?",
+            (t_hash, m_hash, steps),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put_many(self, entries):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO fitness VALUES (?, ?, ?, ?)",
+            [(t, m, s, json.dumps(metrics)) for t, m, s, metrics in entries],
+        )
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+def score(metrics_list, weights):
+    """Aptitud: suma ponderada de las métricas promediadas sobre todos los mapas"""
+    total = 0.0
+    for name, weight in weights.items():
+        total += weight * sum(m[name] for m in metrics_list) / len(metrics_list)
+    return total
+
+def evaluate_population(population, maps, map_hashes, steps, cache, pool):
+    """Devuelve {genoma: [métricas por mapa]} simulando solo lo que no está en caché"""
+    results = {}
+    tasks = []
+    for genome in set(population):
+        t_hash = table_hash(genome)
+        metrics = [cache.get(t_hash, m_hash, steps) for m_hash in map_hashes]
+        results[genome] = metrics
+        missing = [i for i, m in enumerate(metrics) if m is None]
+        if missing:
+            tasks.append((genome, missing, steps))
+
+    if tasks:
+        chunksize = max(1, len(tasks) // (4 * (os.cpu_count() or 1)))
+        new_entries = []
+        for (genome, missing, _), computed in zip(tasks, pool.map(_evaluate_task, tasks, chunksize=chunksize)):
+            t_hash = table_hash(genome)
+            for i, metrics in zip(missing, computed):
+                results[genome][i] = metrics
+                new_entries.append((t_hash, map_hashes[i], steps, metrics))
+        cache.put_many(new_entries)
+    return results
+
+# --- Operadores genéticos ---
+def tournament(ranked, rng, k=3):
+    contenders = rng.sample(ranked, min(k, len(ranked)))
+    return max(contenders, key=lambda item: item[0])[1]
+
+def crossover(a, b, rng):
+    return tuple(x if rng.random() < 0.5 else y for x, y in zip(a, b))
+
+def mutate(genome, rng, rate):
+    return tuple(
+        rng.randrange(len(ACTION_SEQUENCES)) if rng.random() < rate else gene
+        for gene in genome
+    )
+
+def initial_population(size, rng, seed_tables=()):
+    population = []
+    for filename in seed_tables:
+        tabla, _ = agente.load_table(filename)
+        population.append(table_to_genome(tabla, rng))
+    while len(population) < size:
+        population.append(tuple(rng.randrange(len(ACTION_SEQUENCES)) for _ in PERCEPTIONS))
+    return population[:size]
+
+def save_table(genome, metrics_list, fitness, steps, filename):
+    """Escribe la tabla en tablas/ con sus puntajes como comentarios de cabecera"""
+    averaged = {name: sum(m[name] for m in metrics_list) / len(metrics_list) for name in metrics_list[0]}
+    filepath = os.path.join(agente.TABLES_FOLDER, filename)
+    with open(filepath, "w", newline='', encoding='utf-8') as f:
+        f.write(TABLE_HEADER + "\n")
+        f.write(
+            f"# evolucionada: aptitud={fitness:.4f} linea={averaged['linea']:.4f} "
+            f"cobertura={averaged['cobertura']:.4f} contacto={averaged['contacto']:.4f} "
+            f"mapas={len(metrics_list)} pasos={steps}\n"
+        )
+        csv.writer(f).writerows(table_rows(genome))
+    return filepath
+
+# --- Búsqueda evolutiva ---
+def evolve(map_size, generations, population_size, steps, map_seeds, weights,
+           mutation_rate=0.02, elite=2, seed=None, seed_tables=(), workers=None,
+           cache_path=CACHE_PATH):
+    """Evoluciona tablas completas y devuelve [(aptitud, genoma, métricas)] de la última generación ordenada"""
+    if generations < 1:
+        raise ValueError("Se necesita al menos una generación")
+    rng = random.Random(seed)
+    rows, cols = map_size
+    maps = make_maps(rows, cols, map_seeds)
+    map_hashes = [map_hash(m) for m in maps]
+    cache = FitnessCache(cache_path)
+    population = initial_population(population_size, rng, seed_tables)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(maps,)) as pool:
+        for generation in range(generations):
+            results = evaluate_population(population, maps, map_hashes, steps, cache, pool)
+            ranked = sorted(
+                ((score(results[g], weights), g) for g in population),
+                key=lambda item: item[0], reverse=True,
+            )
+            print(f"Generación {generation + 1}/{generations}: mejor={ranked[0][0]:.4f} "
+                  f"media={sum(f for f, _ in ranked) / len(ranked):.4f} "
+                  f"caché={cache.hits} aciertos/{cache.misses} fallos")
+
+            if generation == generations - 1:
+                break
+            next_population = [g for _, g in ranked[:elite]]
+            while len(next_population) < population_size:
+                child = crossover(tournament(ranked, rng), tournament(ranked, rng), rng)
+                next_population.append(mutate(child, rng, mutation_rate))
+            population = next_population
+
+    cache.close()
+    return [(fitness, genome, results[genome]) for fitness, genome in ranked]
+
+def main():
+    parser = argparse.ArgumentParser(description="Búsqueda evolutiva de tablas percepción-acción")
+    parser.add_argument("--filas", type=int, default=agente.ROWS)
+    parser.add_argument("--columnas", type=int, default=agente.COLS)
+    parser.add_argument("--generaciones", type=int, default=30)
+    parser.add_argument("--poblacion", type=int, default=60)
+    parser.add_argument("--pasos", type=int, default=300)
+    parser.add_argument("--mapas", type=int, default=8, help="Número de mapas de evaluación (semillas 0..N-1)")
+    parser.add_argument("--mutacion", type=float, default=0.02)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--peso-linea", type=float, default=1.0)
+    parser.add_argument("--peso-cobertura", type=float, default=1.0)
+    parser.add_argument("--peso-contacto", type=float, default=0.0)
+    parser.add_argument("--desde", nargs="*", default=[], help="Tablas de tablas/ para sembrar la población")
+    parser.add_argument("--guardar", type=int, default=3, help="Cuántas de las mejores tablas escribir en tablas/")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--cache", default=CACHE_PATH)
+    args = parser.parse_args()
+    if args.generaciones < 1:
+        parser.error("--generaciones debe ser al menos 1")
+
+    weights = {"linea": args.peso_linea, "cobertura": args.peso_cobertura, "contacto": args.peso_contacto}
+    ranked = evolve(
+        (args.filas, args.columnas), args.generaciones, args.poblacion, args.pasos,
+        list(range(args.mapas)), weights, args.mutacion, seed=args.semilla,
+        seed_tables=args.desde, workers=args.procesos, cache_path=args.cache,
+    )
+
+    # La élite se repite en la población: guardar solo tablas distintas
+    unique = []
+    for item in ranked:
+        if item[1] not in [g for _, g, _ in unique]:
+            unique.append(item)
+
+    timestamp = datetime.now().strftime("%d%m%Y-%H%M%S")
+    for rank, (fitness, genome, metrics) in enumerate(unique[:args.guardar], start=1):
+        path = save_table(genome, metrics, fitness, args.pasos, f"evolucionada-{timestamp}-{rank}.csv")
+        print(f"Tabla guardada: {path} (aptitud={fitness:.4f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import os
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+# Sin ventana: el driver dummy debe fijarse antes de inicializar pygame
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+import agente
+
+MAX_PENDING_PER_WORKER = 8  # Frames en vuelo por proceso antes de esperar al pool
+MAX_PENDING_BYTES = 512 * 1024 * 1024  # Tope de bytes de frames crudos en vuelo, sin importar los núcleos
+
+# --- Codificación de frames (se ejecuta en los procesos del pool) ---
+def encode_png(path, raw, size):
+    """Guarda un frame RGB crudo como PNG"""
+    surface = pygame.image.frombuffer(raw, size, "RGB")
+    pygame.image.save(surface, path)
+    return path
+
+def encode_gif_frame(raw, previous_raw, size, duration, colors=64):
+    """Codifica un frame del GIF (cabecera local, paleta propia y datos LZW) listo para escribir.
+
+    Con `previous_raw` solo se codifica el rectángulo que cambió respecto al frame anterior.
+    """
+    from PIL import Image, ImageChops, GifImagePlugin
+    image = Image.frombytes("RGB", size, raw)
+    offset = (0, 0)
+    if previous_raw is not None:
+        # Frame idéntico: se escribe un píxel para conservar la duración
+        bbox = ImageChops.difference(image, Image.frombytes("RGB", size, previous_raw)).getbbox() or (0, 0, 1, 1)
+        image = image.crop(bbox)
+        offset = bbox[:2]
+    frame = image.quantize(colors=colors)
+    # disposal=1: el frame queda dibujado y el siguiente se pinta encima
+    return b"".join(GifImagePlugin.getdata(frame, offset, duration=duration, disposal=1, include_color_table=True))
+
+def gif_header(size):
+    """Cabecera GIF89a con el tamaño del lienzo y repetición infinita"""
+    from PIL import Image, GifImagePlugin
+    header, _ = GifImagePlugin.getheader(Image.new("P", size), info={"loop": 0})
+    return b"".join(header)
+
+# --- Simulación sin ventana ---
+def render_frames(selected_table, map_size, steps, seed=None, cell_size=None):
+    """Ejecuta la simulación y genera (iteración, bytes RGB, tamaño) por cada paso.
+
+    Sin `cell_size`, las celdas se achican como en run_simulation para que el frame
+    no supere el tamaño máximo de la ventana.
+    """
+    rows, cols = map_size
+    if cell_size is None:
+        cell_size, size = agente.fit_cell_size(rows, cols)
+    else:
+        size = (cols * cell_size + agente.PANEL_WIDTH, rows * cell_size)
+    world = agente.World.generate(rows, cols, density=agente.DENSITY, table_name=selected_table,
+                                  seed=seed, cell_size=cell_size)
+    tabla, rule_indices = world.tabla, world.rule_indices
+
+    pygame.init()
+    surface = pygame.Surface(size)
+
+    agent = agente.Agent(world)
+    percep = agente.sense(world, agent)
+    acciones, percep, regla_idx = agente.decide(percep, tabla, rule_indices)
+
+    for iteracion in range(steps + 1):
+        if iteracion > 0:
+            for a in list(acciones):
+                agente.ejecutar(agent, world, a)
+            percep = agente.sense(world, agent)
+            acciones, percep, regla_idx = agente.decide(percep, tabla, rule_indices)
+        agente.draw(surface, world, agent, percep, acciones, iteracion, regla_idx, "automatic_fast")
+        yield iteracion, pygame.image.tostring(surface, "RGB"), size
+
+def _pending_limit(workers, task_bytes):
+    """Tareas en vuelo permitidas: MAX_PENDING_PER_WORKER por proceso, sin pasar de MAX_PENDING_BYTES"""
+    return max(1, min(workers * MAX_PENDING_PER_WORKER, MAX_PENDING_BYTES // task_bytes))
+
+def _drain(pending, limit):
+    """Espera a los frames más antiguos hasta dejar como máximo `limit` en vuelo"""
+    results = []
+    while len(pending) > limit:
+        results.append(pending.pop(0).result())
+    return results
+
+# --- Exportación ---
+def export_png(selected_table, map_size, steps, output_dir, seed=None, workers=None, cell_size=None):
+    """Exporta la simulación como secuencia numerada frame-00000.png, frame-00001.png, ..."""
+    os.makedirs(output_dir, exist_ok=True)
+    workers = workers or os.cpu_count() or 1
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        for iteracion, raw, size in render_frames(selected_table, map_size, steps, seed, cell_size):
+            path = os.path.join(output_dir, f"frame-{iteracion:05d}.png")
+            pending.append(pool.submit(encode_png, path, raw, size))
+            written += len(_drain(pending, _pending_limit(workers, len(raw))))
+        written += len(_drain(pending, 0))
+    pygame.quit()
+    print(f"Frames exportados: {written} en {output_dir}")
+    return written
+
+def export_gif(selected_table, map_size, steps, output_path, seed=None, workers=None, duration=50, cell_size=None):
+    """Exporta la simulación como GIF animado; cada frame se codifica en el pool y se escribe en cuanto llega"""
+    workers = workers or os.cpu_count() or 1
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    written = 0
+    with open(output_path, "wb") as f, ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []
+        previous = None
+        for _, raw, size in render_frames(selected_table, map_size, steps, seed, cell_size):
+            if previous is None:
+                f.write(gif_header(size))
+            pending.append(pool.submit(encode_gif_frame, raw, previous, size, duration))
+            previous = raw
+            # Los frames listos se escriben en orden y se descartan
+            # Cada tarea lleva el frame y el anterior
+            for data in _drain(pending, _pending_limit(workers, 2 * len(raw))):
+                f.write(data)
+                written += 1
+        for data in _drain(pending, 0):
+            f.write(data)
+            written += 1
+        f.write(b";")  # Fin del GIF
+    pygame.quit()
+    print(f"GIF exportado: {output_path} ({written} frames)")
+    return written
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta una simulación sin ventana como PNG o GIF")
+    parser.add_argument("tabla", help="Archivo CSV dentro de tablas/")
+    parser.add_argument("--filas", type=int, default=agente.ROWS)
+    parser.add_argument("--columnas", type=int, default=agente.COLS)
+    parser.add_argument("--pasos", type=int, default=200)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--formato", choices=["png", "gif"], default="png")
+    parser.add_argument("--salida", default=None, help="Carpeta (png) o archivo (gif) de destino")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos para codificar (por defecto, todos los núcleos)")
+    parser.add_argument("--duracion", type=int, default=50, help="Milisegundos por frame en el GIF")
+    parser.add_argument("--celda", type=int, default=None,
+                        help="Píxeles por celda (por defecto, como la ventana: se achica en mapas grandes)")
+    args = parser.parse_args()
+
+    map_size = (args.filas, args.columnas)
+    if args.formato == "png":
+        output = args.salida or os.path.join("salida", "frames")
+        export_png(args.tabla, map_size, args.pasos, output, args.semilla, args.procesos, args.celda)
+    else:
+        output = args.salida or os.path.join("salida", "demo.gif")
+        export_gif(args.tabla, map_size, args.pasos, output, args.semilla, args.procesos, args.duracion,
+                   args.celda)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import os
+import sys
+import atexit
+import signal
+import struct
+import argparse
+import itertools
+import threading
+from array import array
+from multiprocessing import Pool, shared_memory
+
+import agente
+import evolucion
+
+# Cabecera del segmento: filas y columnas como dos enteros de 32 bits
+HEADER = struct.Struct("<ii")
+
+# Segmentos publicados por este proceso, para liberarlos si la ejecución se interrumpe
+_owned = {}
+
+def _cleanup_owned():
+    for shm in list(_owned.values()):
+        _release(shm, unlink=True)
+
+def _release(shm, unlink):
+    _owned.pop(shm.name, None)
+    if not _owned:
+        _restore_sigterm()
+    try:
+        shm.close()
+    except BufferError:
+        # Aún hay vistas vivas del buffer; el sistema lo libera al terminar el proceso
+        pass
+    if unlink:
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+def _on_sigterm(signum, frame):
+    # Convertir SIGTERM en SystemExit para que se ejecuten los finally y atexit
+    sys.exit(128 + signum)
+
+def _in_main_thread():
+    return threading.current_thread() is threading.main_thread()
+
+def _install_sigterm():
+    """Instala _on_sigterm mientras haya segmentos propios, solo si nadie más maneja SIGTERM"""
+    if _in_main_thread() and signal.getsignal(signal.SIGTERM) is signal.SIG_DFL:
+        signal.signal(signal.SIGTERM, _on_sigterm)
+
+def _restore_sigterm():
+    """Devuelve SIGTERM a su comportamiento por defecto al liberar el último segmento propio"""
+    if _in_main_thread() and signal.getsignal(signal.SIGTERM) is _on_sigterm:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+atexit.register(_cleanup_owned)
+
+class SharedMap:
+    """Mapa de create_map publicado una sola vez en memoria compartida.
+
+    El proceso que lo publica es el dueño y lo elimina al cerrar (o al salir,
+    incluso por Ctrl+C o SIGTERM). Los trabajadores se adjuntan por nombre y
+    obtienen una vista de solo lectura sin copiar los datos, indexable como el
+    grid original: grid[r][c].
+    """
+
+    def __init__(self, shm, owner):
+        self.shm = shm
+        self.owner = owner
+        self.rows, self.cols = HEADER.unpack_from(shm.buf, 0)
+        self._rows = None
+        self._views = []
+
+    @classmethod
+    def publish(cls, grid, name=None):
+        rows, cols = len(grid), len(grid[0])
+        return cls.publish_bytes(rows, cols, array("b", itertools.chain.from_iterable(grid)).tobytes(), name)
+
+    @classmethod
+    def publish_bytes(cls, rows, cols, data, name=None):
+        """Publica un mapa ya empaquetado: un byte con signo por celda, fila por fila"""
+        if len(data) != rows * cols:
+            raise ValueError(f"Se esperaban {rows * cols} bytes y llegaron {len(data)}")
+        shm = shared_memory.SharedMemory(name=name, create=True, size=HEADER.size + rows * cols)
+        _owned[shm.name] = shm
+        try:
+            HEADER.pack_into(shm.buf, 0, rows, cols)
+            shm.buf[HEADER.size:HEADER.size + rows * cols] = data
+        except BaseException:
+            _release(shm, unlink=True)
+            raise
+        _install_sigterm()
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        # Solo el dueño debe eliminar el segmento. Desde 3.13 se puede pedir que
+        # no se rastree; antes, los procesos del pool comparten el resource_tracker
+        # del dueño, así que adjuntarse no provoca una eliminación prematura
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            shm = shared_memory.SharedMemory(name=name)
+        return cls(shm, owner=False)
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def grid(self):
+        """Filas como memoryviews de solo lectura: grid[r][c] devuelve -1, 0 o 1"""
+        if self._rows is None:
+            raw = self.shm.buf[HEADER.size:]
+            readonly = raw.toreadonly()
+            data = readonly.cast('b')
+            self._views = [raw, readonly, data]
+            self._rows = [data[r * self.cols:(r + 1) * self.cols] for r in range(self.rows)]
+        return self._rows
+
+    def as_array(self):
+        """Vista NumPy (filas, columnas) de solo lectura, también sin copia"""
+        import numpy as np
+        array = np.ndarray((self.rows, self.cols), dtype=np.int8, buffer=self.shm.buf, offset=HEADER.size)
+        array.flags.writeable = False
+        return array
+
+    def close(self):
+        if self._rows is not None:
+            for view in self._rows + self._views[::-1]:
+                view.release()
+            self._rows = None
+            self._views = []
+        _release(self.shm, unlink=self.owner)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# --- Uso desde un pool de procesos ---
+_worker_map = None
+_worker_world = None
+_worker_free_cells = None
+_worker_tables = {}
+
+def init_worker(name):
+    """Inicializador del pool: se adjunta al mapa compartido una vez por proceso"""
+    global _worker_map, _worker_world, _worker_free_cells
+    # El manejador de SIGTERM del dueño se hereda al hacer fork; en el trabajador
+    # el pool atraparía el SystemExit como error de tarea y seguiría ejecutando
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    _worker_map = SharedMap.attach(name)
+    _worker_world = agente.World(_worker_map.grid)
+    # Solo el conteo: el índice de celdas libres (lista + dict por celda) no hace falta
+    # porque las posiciones iniciales ya vienen dadas
+    _worker_free_cells = _worker_world.free_count
+    atexit.register(_worker_map.close)
+
+def worker_grid():
+    return _worker_map.grid
+
+def worker_world():
+    """World del trabajador sobre el mapa compartido (el índice de celdas libres, si se usa, es local)"""
+    return _worker_world
+
+def _evaluate_start(task):
+    filename, start, steps = task
+    if filename not in _worker_tables:
+        _worker_tables[filename] = agente.load_table(filename)
+    tabla, rule_indices = _worker_tables[filename]
+    return start, evolucion.simulate(worker_world(), start, tabla, rule_indices, steps, _worker_free_cells)
+
+def evaluate_starts(filename, grid, starts, steps, workers=None):
+    """Evalúa una tabla desde muchas posiciones iniciales sobre un mismo mapa compartido"""
+    with SharedMap.publish(grid) as shared:
+        # multiprocessing.Pool en lugar de ProcessPoolExecutor: terminate() detiene a los trabajadores
+        pool = Pool(processes=workers, initializer=init_worker, initargs=(shared.name,))
+        try:
+            tasks = [(filename, start, steps) for start in starts]
+            chunksize = max(1, len(tasks) // (4 * (workers or os.cpu_count() or 1)))
+            results = pool.map(_evaluate_start, tasks, chunksize=chunksize)
+        except BaseException:
+            # Interrupción: eliminar el segmento antes que nada y detener a los
+            # trabajadores en lugar de esperar a que terminen su lote actual
+            shared.close()
+            pool.terminate()
+            pool.join()
+            raise
+        pool.close()
+        pool.join()
+        return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa una tabla desde muchas posiciones en un mapa grande compartido")
+    parser.add_argument("tabla")
+    parser.add_argument("--filas", type=int, default=1001)
+    parser.add_argument("--columnas", type=int, default=1001)
+    parser.add_argument("--inicios", type=int, default=1000)
+    parser.add_argument("--pasos", type=int, default=1000)
+    parser.add_argument("--semilla", type=int, default=None)
+    parser.add_argument("--procesos", type=int, default=None)
+    args = parser.parse_args()
+
+    world = agente.World.generate(args.filas, args.columnas, density=agente.DENSITY, seed=args.semilla)
+    starts = []
+    for _ in range(args.inicios):
+        agent = agente.Agent(world)
+        starts.append((agent.x, agent.y, agent.orient))
+
+    results = evaluate_starts(args.tabla, world.grid, starts, args.pasos, args.procesos)
+    for name in ("linea", "cobertura", "contacto"):
+        mean = sum(m[name] for _, m in results) / len(results)
+        print(f"{name}: {mean:.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Se ejecuta en un intérprete nuevo para medir un arranque en frío real
+PROBE = r"""
+import sys, time, json
+t0 = time.perf_counter()
+import agente
+t1 = time.perf_counter()
+world = agente.World.generate({rows}, {cols}, table_name={table!r})
+agent = agente.Agent(world)
+acciones, _, _ = agente.decide(agente.sense(world, agent), world.tabla, world.rule_indices)
+for a in acciones:
+    agente.ejecutar(agent, world, a)
+t2 = time.perf_counter()
+loaded = "pygame" in sys.modules
+import pygame
+t3 = time.perf_counter()
+print(json.dumps({{"import": t1 - t0, "first_step": t2 - t0, "pygame_loaded": loaded, "pygame_import": t3 - t2}}))
+"""
+
+def measure(table, rows, cols, runs):
+    """Lanza `runs` procesos nuevos y devuelve las mediciones de cada uno"""
+    code = PROBE.format(table=table, rows=rows, cols=cols)
+    results = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el tiempo de importación y del primer paso sin ventana")
+    parser.add_argument("--tabla", default="percepcion-accion.csv")
+    parser.add_argument("--filas", type=int, default=11)
+    parser.add_argument("--columnas", type=int, default=11)
+    parser.add_argument("--repeticiones", type=int, default=10)
+    args = parser.parse_args()
+
+    results = measure(args.tabla, args.filas, args.columnas, args.repeticiones)
+    import_ms = statistics.median(r["import"] for r in results) * 1000
+    first_step_ms = statistics.median(r["first_step"] for r in results) * 1000
+    pygame_ms = statistics.median(r["pygame_import"] for r in results) * 1000
+
+    print(f"Procesos medidos: {len(results)} (mediana)")
+    print(f"  {'import agente:':<26}{import_ms:8.2f} ms")
+    print(f"  {'hasta el primer paso:':<26}{first_step_ms:8.2f} ms")
+    print(f"  {'import pygame (evitado):':<26}{pygame_ms:8.2f} ms")
+    print(f"  {'pygame cargado:':<26}{'sí' if any(r['pygame_loaded'] for r in results) else 'no':>8}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+import os
+import csv
+import time
+import argparse
+
+import agente
+
+# --- Geometría de la ventana ---
+# La ventana es un cuadrado de (2r+1)x(2r+1) celdas en el marco del agente:
+# la primera fila es la más lejana hacia delante y cada fila va de izquierda a
+# derecha. Con radio 1 la primera fila es exactamente (izq, cen, der) de sense()
+# y la celda central es el piso.
+ORIENTS = ['N', 'E', 'S', 'W']
+ORIENT_INDEX = {o: i for i, o in enumerate(ORIENTS)}
+FORWARD = {'N': (-1, 0), 'E': (0, 1), 'S': (1, 0), 'W': (0, -1)}
+RIGHT = {'N': (0, 1), 'E': (1, 0), 'S': (0, -1), 'W': (-1, 0)}
+
+# Cada celda ocupa 2 bits: P=0, .=1, L=2 (valor del grid + 1; fuera del mapa es pared).
+# El bit de contacto va justo después de la última celda.
+CELL_SYMBOLS = 'P.L'
+WILDCARD = '?'
+DEFAULT_ACTIONS = ['ROTAR+90', 'AVANZAR']  # Igual que decide() cuando ninguna regla coincide
+WIDE_TABLES_FOLDER = os.path.join(agente.TABLES_FOLDER, "amplias")
+
+class WindowLayout:
+    """Geometría precalculada de una ventana de radio dado para las cuatro orientaciones"""
+
+    _cache = {}
+
+    def __init__(self, radius):
+        if radius < 1:
+            raise ValueError("El radio debe ser al menos 1")
+        self.radius = radius
+        self.size = size = 2 * radius + 1
+        self.cells = size * size
+        self.contact_shift = 2 * self.cells
+        self.strip_mask = (1 << (2 * size)) - 1
+        # Desplazamiento en el mundo de cada celda k, por orientación
+        self.offsets = []
+        for o in ORIENTS:
+            (fx, fy), (rx, ry) = FORWARD[o], RIGHT[o]
+            self.offsets.append([
+                ((radius - i) * fx + (j - radius) * rx, (radius - i) * fy + (j - radius) * ry)
+                for i in range(size) for j in range(size)
+            ])
+        self.index = [{off: k for k, off in enumerate(offs)} for offs in self.offsets]
+        self.moves = {FORWARD[d]: self._move_plan(FORWARD[d]) for d in ORIENTS}
+
+    @classmethod
+    def get(cls, radius):
+        if radius not in cls._cache:
+            cls._cache[radius] = cls(radius)
+        return cls._cache[radius]
+
+    def _move_plan(self, move):
+        """Para un paso de una celda, por orientación: (corrimiento, máscara, bits de la franja, memo)"""
+        r, size = self.radius, self.size
+        mx, my = move
+        # Franja nueva (borde del cuadrado en la dirección del movimiento) en orden
+        # creciente de columna (movimiento vertical) o de fila (horizontal)
+        if mx:
+            strip = [(mx * r, d) for d in range(-r, r + 1)]
+        else:
+            strip = [(d, my * r) for d in range(-r, r + 1)]
+        plans = []
+        for o in ORIENTS:
+            (fx, fy), (rx, ry) = FORWARD[o], RIGHT[o]
+            mf, mr = mx * fx + my * fy, mx * rx + my * ry
+            # La celda (i, j) nueva es la (i - mf, j + mr) anterior
+            delta = -mf * size + mr
+            mask = 0
+            for i in range(size):
+                for j in range(size):
+                    if 0 <= i - mf < size and 0 <= j + mr < size:
+                        mask |= 3 << (2 * (i * size + j))
+            positions = [2 * self.index[ORIENT_INDEX[o]][off] for off in strip]
+            plans.append((2 * delta, mask, positions, {}))
+        return plans
+
+    def spread(self, plan, packed):
+        """Reubica una franja empaquetada en los bits de la ventana de una orientación (memorizado)"""
+        positions, memo = plan[2], plan[3]
+        bits = memo.get(packed)
+        if bits is None:
+            bits = 0
+            for j, bit in enumerate(positions):
+                bits |= ((packed >> (2 * j)) & 3) << bit
+            memo[packed] = bits
+        return bits
+
+def cell_code(grid, rows, cols, x, y):
+    if 0 <= x < rows and 0 <= y < cols:
+        return grid[x][y] + 1
+    return 0
+
+# --- Sensor incremental ---
+class WideSensor:
+    """Percepción empaquetada en un entero, actualizada por franjas cuando el agente avanza.
+
+    Mantiene la ventana ya rotada para las cuatro orientaciones, así que girar no
+    cuesta nada. El mapa se guarda también empaquetado por filas y por columnas
+    (2 bits por celda, con un margen de pared de r celdas): la franja de 2r+1
+    celdas que entra al avanzar se extrae con un corrimiento en lugar de leer
+    celda por celda. Toda edición del mapa debe avisarse con cell_changed().
+    """
+
+    def __init__(self, world, radius):
+        self.world = world
+        self.layout = WindowLayout.get(radius)
+        self.windows = [0, 0, 0, 0]
+        self.pos = None
+        r = radius
+        self._row_bits = [0] * (world.rows + 2 * r)
+        self._col_bits = [0] * (world.cols + 2 * r)
+        for x, row in enumerate(world.grid):
+            for y, value in enumerate(row):
+                self._row_bits[x + r] |= (value + 1) << (2 * (y + r))
+                self._col_bits[y + r] |= (value + 1) << (2 * (x + r))
+
+    def reset(self, x, y):
+        """Recalcula las cuatro ventanas a partir de las filas empaquetadas"""
+        r, mask = self.layout.radius, self.layout.strip_mask
+        codes = {}
+        for dx in range(-r, r + 1):
+            segment = (self._row_bits[x + dx + r] >> (2 * y)) & mask
+            for dy in range(-r, r + 1):
+                codes[(dx, dy)] = (segment >> (2 * (dy + r))) & 3
+        for o, offsets in enumerate(self.layout.offsets):
+            window = 0
+            for k, off in enumerate(offsets):
+                window |= codes[off] << (2 * k)
+            self.windows[o] = window
+        self.pos = (x, y)
+
+    def _shift(self, move):
+        layout = self.layout
+        r = layout.radius
+        x, y = self.pos[0] + move[0], self.pos[1] + move[1]
+        if move[0]:
+            packed = (self._row_bits[x + move[0] * r + r] >> (2 * y)) & layout.strip_mask
+        else:
+            packed = (self._col_bits[y + move[1] * r + r] >> (2 * x)) & layout.strip_mask
+        windows = self.windows
+        for o, plan in enumerate(layout.moves[move]):
+            shift = plan[0]
+            window = windows[o] >> shift if shift > 0 else windows[o] << -shift
+            windows[o] = (window & plan[1]) | layout.spread(plan, packed)
+        self.pos = (x, y)
+
+    def observe(self, agent):
+        """Código de percepción del agente: ventana rotada más el bit de contacto"""
+        if self.pos is None:
+            self.reset(agent.x, agent.y)
+        elif (agent.x, agent.y) != self.pos:
+            dx, dy = agent.x - self.pos[0], agent.y - self.pos[1]
+            if abs(dx) + abs(dy) <= self.layout.radius:
+                # Pocos pasos en un mismo turno: aplicar las franjas una a una
+                for _ in range(abs(dx)):
+                    self._shift((1 if dx > 0 else -1, 0))
+                for _ in range(abs(dy)):
+                    self._shift((0, 1 if dy > 0 else -1))
+            else:
+                self.reset(agent.x, agent.y)
+        return self.windows[ORIENT_INDEX[agent.orient]] | ((agent.contact == '1') << self.layout.contact_shift)
+
+    def cell_changed(self, r, c):
+        """Actualiza el mapa empaquetado (y la ventana, si la celda cae dentro) tras editar (r, c)"""
+        pad = self.layout.radius
+        code = self.world.grid[r][c] + 1
+        row_bit, col_bit = 2 * (c + pad), 2 * (r + pad)
+        self._row_bits[r + pad] = (self._row_bits[r + pad] & ~(3 << row_bit)) | (code << row_bit)
+        self._col_bits[c + pad] = (self._col_bits[c + pad] & ~(3 << col_bit)) | (code << col_bit)
+        if self.pos is None:
+            return
+        off = (r - self.pos[0], c - self.pos[1])
+        if off not in self.layout.index[0]:
+            return
+        for o, index in enumerate(self.layout.index):
+            bit = 2 * index[off]
+            self.windows[o] = (self.windows[o] & ~(3 << bit)) | (code << bit)
+
+    def invalidate(self):
+        self.pos = None
+
+def full_observe(world, agent, radius):
+    """Percepción calculada desde cero en cada llamada (referencia y comparación de rendimiento)"""
+    layout = WindowLayout.get(radius)
+    grid, rows, cols = world.grid, world.rows, world.cols
+    code = 0
+    for k, (dx, dy) in enumerate(layout.offsets[ORIENT_INDEX[agent.orient]]):
+        code |= cell_code(grid, rows, cols, agent.x + dx, agent.y + dy) << (2 * k)
+    return code | ((agent.contact == '1') << layout.contact_shift)
+
+def format_percept(code, radius):
+    """Patrón legible 'fila/fila/...' y contacto, en el mismo formato que las tablas"""
+    layout = WindowLayout.get(radius)
+    cells = [CELL_SYMBOLS[(code >> (2 * k)) & 3] for k in range(layout.cells)]
+    rows = ["".join(cells[i:i + layout.size]) for i in range(0, layout.cells, layout.size)]
+    return "/".join(rows), str((code >> layout.contact_shift) & 1)
+
+# --- Tablas con comodines ---
+def compile_pattern(pattern, contacto, radius):
+    """Convierte un patrón con comodines '?' en (máscara, valor) sobre el código empaquetado"""
+    layout = WindowLayout.get(radius)
+    rows = pattern.split("/")
+    if len(rows) != layout.size or any(len(row) != layout.size for row in rows):
+        raise ValueError(f"El patrón {pattern!r} no es de {layout.size}x{layout.size}")
+    mask = value = 0
+    for k, symbol in enumerate("".join(rows)):
+        if symbol == WILDCARD:
+            continue
+        if symbol not in CELL_SYMBOLS:
+            raise ValueError(f"Símbolo desconocido {symbol!r} en {pattern!r}")
+        mask |= 3 << (2 * k)
+        value |= CELL_SYMBOLS.index(symbol) << (2 * k)
+    if contacto != WILDCARD:
+        if contacto not in "01":
+            raise ValueError(f"Contacto inválido {contacto!r}")
+        mask |= 1 << layout.contact_shift
+        value |= int(contacto) << layout.contact_shift
+    return mask, value
+
+class WideTable:
+    """Reglas (patrón, contacto, acciones) evaluadas en orden: gana la primera que coincide.
+
+    Los resultados se memorizan por código de percepción, así que cada percepción
+    distinta recorre las reglas una sola vez aunque el espacio de claves sea enorme.
+    """
+
+    def __init__(self, radius, rules):
+        self.radius = radius
+        self.rules = rules  # [(máscara, valor, acciones, número de regla)]
+        self._decisions = {}
+
+    @classmethod
+    def load(cls, path):
+        rules = []
+        radius = None
+        with open(path, newline='', encoding='utf-8') as f:
+            line_num = 0
+            for row in csv.reader(f):
+                if not row or row[0].startswith('#'):
+                    continue
+                line_num += 1
+                pattern, contacto, *acciones = [x.strip() for x in row]
+                if radius is None:
+                    radius = pattern.count("/") // 2  # 2r+1 filas separadas por '/'
+                mask, value = compile_pattern(pattern, contacto, radius)
+                rules.append((mask, value, acciones, line_num))
+        if radius is None:
+            raise ValueError(f"La tabla {path} no tiene reglas")
+        return cls(radius, rules)
+
+    @classmethod
+    def from_classic(cls, tabla, rule_indices):
+        """Tabla de radio 1 equivalente a una tabla clásica de load_table()"""
+        rules = []
+        for key in sorted(tabla, key=rule_indices.get):
+            piso, izq, cen, der, contacto = key
+            pattern = f"{izq}{cen}{der}/?{'L' if piso == '1' else '.'}?/???"
+            mask, value = compile_pattern(pattern, contacto, 1)
+            rules.append((mask, value, tabla[key], rule_indices[key]))
+        return cls(1, rules)
+
+    def decide(self, code):
+        """Devuelve (acciones, número de regla) como decide(); None si ninguna coincide"""
+        decision = self._decisions.get(code)
+        if decision is None:
+            decision = (DEFAULT_ACTIONS, None)
+            for mask, value, acciones, rule_num in self.rules:
+                if code & mask == value:
+                    decision = (acciones, rule_num)
+                    break
+            self._decisions[code] = decision
+        return decision
+
+# --- Simulación ---
+def simulate(world, agent, table, steps, incremental=True):
+    """Ejecuta `steps` reglas y devuelve la lista de (código de percepción, regla)"""
+    sensor = WideSensor(world, table.radius)
+    history = []
+    for _ in range(steps):
+        if incremental:
+            code = sensor.observe(agent)
+        else:
+            code = full_observe(world, agent, table.radius)
+        acciones, rule_num = table.decide(code)
+        for a in acciones:
+            agente.ejecutar(agent, world, a)
+        history.append((code, rule_num))
+    return history
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula con percepción amplia y compara el sensor incremental con el completo")
+    parser.add_argument("tabla", help=f"Tabla con comodines (ruta o nombre dentro de {WIDE_TABLES_FOLDER}/)")
+    parser.add_argument("--clasica", action="store_true", help="La tabla es una tabla clásica de tablas/ (radio 1)")
+    parser.add_argument("--filas", type=int, default=101)
+    parser.add_argument("--columnas", type=int, default=101)
+    parser.add_argument("--pasos", type=int, default=100_000)
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.clasica:
+        table = WideTable.from_classic(*agente.load_table(args.tabla))
+    else:
+        path = args.tabla if os.path.exists(args.tabla) else os.path.join(WIDE_TABLES_FOLDER, args.tabla)
+        table = WideTable.load(path)
+    size = 2 * table.radius + 1
+
+    results = {}
+    for label, incremental in (("incremental", True), ("completo", False)):
+        world = agente.World.generate(args.filas, args.columnas, density=agente.DENSITY, seed=args.semilla)
+        agent = agente.Agent(world)
+        start = time.perf_counter()
+        history = simulate(world, agent, table, args.pasos, incremental)
+        elapsed = time.perf_counter() - start
+        results[label] = history
+        print(f"Sensor {label:<12} ventana {size}x{size}: {args.pasos / elapsed:12,.0f} pasos/s")
+
+    same = results["incremental"] == results["completo"]
+    print(f"Percepciones idénticas: {'sí' if same else 'NO'}")
+    print(f"Reglas: {len(table.rules)}, percepciones distintas vistas: {len(table._decisions)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+import os
+import json
+import shutil
+import tempfile
+import asyncio
+import argparse
+import itertools
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+
+import agente
+from mapa_compartido import SharedMap
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_STEPS_PER_REQUEST = 1_000_000
+# Límite de una línea JSON en cliente y servidor: alcanza para las filas de un lote de
+# MAX_STEPS_PER_REQUEST pasos (unos 100 bytes por fila) o el grid de un mapa grande
+STREAM_LIMIT = 256 * 1024 * 1024
+TRACE_INDEX_STEP = 1024  # Se guarda la posición en disco de una de cada tantas filas de traza
+MAX_WORKER_MAPS = 32  # Mapas de sesión que cada proceso del pool mantiene adjuntos
+
+# --- Trabajo pesado (se ejecuta en los procesos del pool) ---
+# Cada proceso guarda las tablas ya leídas para no volver a parsearlas en cada lote
+_worker_tables = {}
+
+def _get_table(filename):
+    if filename not in _worker_tables:
+        _worker_tables[filename] = agente.load_table(filename)
+    return _worker_tables[filename]
+
+# El mapa de cada sesión vive en memoria compartida (lo publica el servidor); cada
+# proceso se adjunta la primera vez que avanza esa sesión y conserva los más recientes
+_worker_worlds = OrderedDict()
+
+def _get_world(map_name):
+    entry = _worker_worlds.get(map_name)
+    if entry is None:
+        shared = SharedMap.attach(map_name)
+        entry = _worker_worlds[map_name] = (shared, agente.World(shared.grid))
+        if len(_worker_worlds) > MAX_WORKER_MAPS:
+            _, (old, _) = _worker_worlds.popitem(last=False)
+            old.close()
+    else:
+        _worker_worlds.move_to_end(map_name)
+    return entry[1]
+
+def _observe(state, world, agent, tabla, rule_indices):
+    """Añade al estado la percepción actual y la regla que se aplicará en el siguiente paso"""
+    percep = agente.sense(world, agent)
+    acciones, percep, regla_idx = agente.decide(percep, tabla, rule_indices)
+    state["percepcion"] = list(percep)
+    state["regla"] = regla_idx
+    state["acciones"] = list(acciones)
+    return state
+
+def _make_agent(state, world):
+    x, y = state["pos"]
+    agent = agente.Agent(world, x, y, state["orientacion"])
+    agent.contact = state["contacto"]
+    return agent
+
+def create_session_state(filename, rows, cols, seed, density):
+    """Genera el mapa y la posición inicial de una sesión nueva; devuelve (estado, mapa empaquetado)"""
+    world = agente.World.generate(rows, cols, density=density, seed=seed)
+    agent = agente.Agent(world)
+    state = {
+        "tabla": filename,
+        "filas": rows,
+        "columnas": cols,
+        "mapa": None,  # Nombre del segmento compartido, lo completa el servidor
+        "pos": [agent.x, agent.y],
+        "orientacion": agent.orient,
+        "contacto": agent.contact,
+        "iteracion": 0,
+    }
+    # Un byte por celda: es lo único que cruza hacia el servidor, y una sola vez
+    grid_bytes = world.get_state()["grid"]
+    return _observe(state, world, agent, *_get_table(filename)), grid_bytes
+
+def step_session_state(state, steps, trace_path, trace_size, keep_rows=False):
+    """Avanza `steps` reglas escribiendo la traza en `trace_path` (una fila JSON por línea).
+
+    Devuelve (nuevo estado, filas si `keep_rows`, nuevo tamaño de la traza,
+    posiciones de las filas múltiplo de TRACE_INDEX_STEP).
+    """
+    tabla, rule_indices = _get_table(state["tabla"])
+    world = _get_world(state["mapa"])
+    agent = _make_agent(state, world)
+    iteracion = state["iteracion"]
+    rows = [] if keep_rows else None
+    offsets = []
+    with open(trace_path, "r+b" if trace_size else "wb") as f:
+        # Descartar lo que haya dejado un lote anterior que falló a mitad
+        f.truncate(trace_size)
+        f.seek(trace_size)
+        for _ in range(steps):
+            percep = agente.sense(world, agent)
+            acciones, percep, regla_idx = agente.decide(percep, tabla, rule_indices)
+            if iteracion % TRACE_INDEX_STEP == 0:
+                offsets.append(f.tell())
+            iteracion += 1
+            pos_inicial, orient_inicial = (agent.x, agent.y), agent.orient
+            for a in acciones:
+                agente.ejecutar(agent, world, a)
+            row = agente.trace_row(iteracion, pos_inicial, orient_inicial, percep, regla_idx,
+                                   acciones, (agent.x, agent.y), agent.orient)
+            f.write((json.dumps(row, ensure_ascii=False) + "\n").encode("utf-8"))
+            if keep_rows:
+                rows.append(row)
+        trace_size = f.tell()
+    state.update(pos=[agent.x, agent.y], orientacion=agent.orient, contacto=agent.contact, iteracion=iteracion)
+    return _observe(state, world, agent, tabla, rule_indices), rows, trace_size, offsets
+
+# --- Sesiones ---
+class Session:
+    """Estado de una sesión; su traza vive en disco y no en la memoria del servidor"""
+
+    def __init__(self, session_id, state, shared_map, trace_dir):
+        self.id = session_id
+        self.state = state
+        self.shared_map = shared_map  # Los lotes solo envían al pool el estado del agente
+        self.trace_path = os.path.join(trace_dir, f"sesion-{session_id}.jsonl")
+        self.trace_size = 0
+        self.trace_index = array("q")  # Posición en disco de las filas 0, TRACE_INDEX_STEP, 2*TRACE_INDEX_STEP...
+        self.lock = asyncio.Lock()  # Los lotes de una misma sesión se ejecutan en orden
+
+    @property
+    def trace_rows(self):
+        return self.state["iteracion"]
+
+    def read_trace(self, start):
+        """Recorre las filas de traza desde `start` hasta las escritas al empezar"""
+        total = self.trace_rows
+        if start >= total:
+            return
+        with open(self.trace_path, "rb") as f:
+            f.seek(self.trace_index[start // TRACE_INDEX_STEP])
+            for _ in range(start % TRACE_INDEX_STEP):
+                f.readline()
+            for _ in range(total - start):
+                yield json.loads(f.readline())
+
+    def close(self):
+        """Elimina la traza y el mapa compartido de la sesión"""
+        try:
+            os.remove(self.trace_path)
+        except FileNotFoundError:
+            pass
+        self.shared_map.close()
+
+    def summary(self, include_grid=False):
+        keys = ["tabla", "filas", "columnas", "pos", "orientacion", "contacto",
+                "iteracion", "percepcion", "regla", "acciones"]
+        data = {k: self.state[k] for k in keys}
+        data["sesion"] = self.id
+        if include_grid:
+            data["grid"] = [row.tolist() for row in self.shared_map.grid]
+        return data
+
+class SimulationServer:
+    """Servidor JSON-lines: una petición JSON por línea, una o más respuestas JSON por línea"""
+
+    def __init__(self, workers=None):
+        # Los procesos del pool deben compartir el resource_tracker del servidor: si
+        # arrancaran uno propio, al terminar eliminarían los mapas a los que se adjuntaron
+        resource_tracker.ensure_running()
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.sessions = {}
+        self._ids = itertools.count(1)
+        self.trace_dir = tempfile.mkdtemp(prefix="servidor-trazas-")
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self.pool, func, *args)
+
+    def _session(self, request):
+        session = self.sessions.get(request.get("sesion"))
+        if session is None:
+            raise KeyError(f"Sesión desconocida: {request.get('sesion')}")
+        return session
+
+    # --- Comandos ---
+    async def cmd_create(self, request, send):
+        filename = request["tabla"]
+        if not os.path.exists(os.path.join(agente.TABLES_FOLDER, filename)):
+            raise FileNotFoundError(f"No existe la tabla {filename}")
+        rows = int(request.get("filas", agente.ROWS))
+        cols = int(request.get("columnas", agente.COLS))
+        if rows < 3 or cols < 3:
+            raise ValueError("El mapa debe tener al menos 3x3 celdas")
+        state, grid_bytes = await self._run(create_session_state, filename, rows, cols,
+                                            request.get("semilla"), float(request.get("densidad", agente.DENSITY)))
+        shared_map = SharedMap.publish_bytes(rows, cols, grid_bytes)
+        state["mapa"] = shared_map.name
+        session = Session(next(self._ids), state, shared_map, self.trace_dir)
+        self.sessions[session.id] = session
+        await send(session.summary())
+
+    async def cmd_step(self, request, send):
+        session = self._session(request)
+        steps = int(request.get("pasos", 1))
+        if not 0 <= steps <= MAX_STEPS_PER_REQUEST:
+            raise ValueError(f"'pasos' debe estar entre 0 y {MAX_STEPS_PER_REQUEST}")
+        async with session.lock:
+            session.state, rows, session.trace_size, offsets = await self._run(
+                step_session_state, session.state, steps, session.trace_path, session.trace_size,
+                bool(request.get("traza")))
+            session.trace_index.extend(offsets)
+        response = session.summary()
+        if request.get("traza"):
+            response["filas"] = rows
+        await send(response)
+
+    async def cmd_state(self, request, send):
+        await send(self._session(request).summary(include_grid=bool(request.get("grid"))))
+
+    async def cmd_trace(self, request, send):
+        """Envía una línea por fila de traza a partir de 'desde' y termina con {"fin": true}"""
+        session = self._session(request)
+        start = max(0, int(request.get("desde", 0)))
+        for i, row in enumerate(session.read_trace(start)):
+            await send({"fila": row}, drain=(i % 256 == 255))
+        await send({"fin": True, "total": session.trace_rows})
+
+    async def cmd_close(self, request, send):
+        session = self._session(request)
+        del self.sessions[session.id]
+        session.close()
+        await send({"sesion": session.id, "cerrada": True})
+
+    async def cmd_list(self, request, send):
+        await send({"sesiones": [s.summary() for s in self.sessions.values()]})
+
+    # --- Conexiones ---
+    async def handle(self, reader, writer):
+        async def send(payload, drain=True):
+            if request_id is not None:
+                payload = {"id": request_id, **payload}
+            writer.write((json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8"))
+            if drain:
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request_id = None
+                try:
+                    request = json.loads(line)
+                    request_id = request.get("id")
+                    handler = getattr(self, f"cmd_{request.get('cmd')}", None)
+                    if handler is None:
+                        raise ValueError(f"Comando desconocido: {request.get('cmd')}")
+                    await handler(request, send)
+                except Exception as e:
+                    await send({"error": f"{type(e).__name__}: {e}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, path=unix_path, limit=STREAM_LIMIT)
+            print(f"Servidor escuchando en {unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle, host, port, limit=STREAM_LIMIT)
+            print(f"Servidor escuchando en {host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+        for session in self.sessions.values():
+            session.shared_map.close()
+        shutil.rmtree(self.trace_dir, ignore_errors=True)
+
+# --- Cliente de prueba ---
+class SimulationClient:
+    """Cliente mínimo para el protocolo JSON-lines del servidor"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, host=DEFAULT_HOST, port=DEFAULT_PORT, unix_path=None):
+        if unix_path:
+            reader, writer = await asyncio.open_unix_connection(unix_path, limit=STREAM_LIMIT)
+        else:
+            reader, writer = await asyncio.open_connection(host, port, limit=STREAM_LIMIT)
+        return cls(reader, writer)
+
+    async def request(self, cmd, **params):
+        self.writer.write((json.dumps({"cmd": cmd, **params}) + "\n").encode("utf-8"))
+        await self.writer.drain()
+        response = json.loads(await self.reader.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    async def trace(self, session_id, start=0):
+        """Recorre las filas de traza de una sesión a medida que llegan"""
+        self.writer.write((json.dumps({"cmd": "trace", "sesion": session_id, "desde": start}) + "\n").encode("utf-8"))
+        await self.writer.drain()
+        while True:
+            response = json.loads(await self.reader.readline())
+            if "error" in response:
+                raise RuntimeError(response["error"])
+            if response.get("fin"):
+                return
+            yield response["fila"]
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor local de simulaciones (JSON-lines sobre TCP o socket Unix)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--puerto", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="Ruta de socket Unix en lugar de TCP")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos para avanzar simulaciones")
+    args = parser.parse_args()
+
+    server = SimulationServer(args.procesos)
+    try:
+        asyncio.run(server.serve(args.host, args.puerto, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+import os
+import csv
+import argparse
+
+# --- Formato ---
+# Primera línea: MAGIC, versión e iteración inicial. Segunda: la cabecera original del CSV.
+# Después, un registro por línea:
+#   R,dx,dy,orient,piso,izq,cen,der,contacto,regla,acciones,ndx,ndy,norient
+#       Fila literal. (dx, dy) es Pos relativa a la Nueva Pos de la fila anterior
+#       (casi siempre 0,0) y (ndx, ndy) es Nueva Pos relativa a Pos.
+#   C,desde,periodo,fase,filas
+#       `filas` filas que repiten cíclicamente las filas literales
+#       desde..desde+periodo-1 (índices absolutos), empezando en `fase`.
+# El número de iteración no se guarda: las filas son consecutivas.
+MAGIC = "#traza-comprimida"
+VERSION = 1
+MAX_PERIOD = 100_000  # Ciclo más largo que se detecta; también acota la memoria de filas literales
+
+def _parse_pos(text):
+    x, y = text.strip("[]").split(",")
+    return int(x), int(y)
+
+def _format_pos(x, y):
+    return f"[{x},{y}]"
+
+class _TraceState:
+    """Filas literales recientes y estado del ciclo en curso, común al codificador y al decodificador"""
+
+    def __init__(self, first_iteration=1):
+        self.literals = []
+        self.base = 0  # Índice absoluto de literals[0]
+        self.keys = {}  # (Pos, orientación, percepción) -> índice absoluto de la última fila literal
+        self.cycle = None  # [desde, periodo, fase, filas]
+        self.last_body = None
+        self.next_iteration = first_iteration
+
+    def literal(self, index):
+        return self.literals[index - self.base]
+
+    def add_literal(self, body):
+        self.keys[body[:7]] = self.base + len(self.literals)
+        self.literals.append(body)
+        if len(self.literals) > 2 * MAX_PERIOD:
+            drop = len(self.literals) - MAX_PERIOD
+            del self.literals[:drop]
+            self.base += drop
+
+    def last_new_pos(self):
+        return _parse_pos(self.last_body[9]) if self.last_body is not None else (0, 0)
+
+    def encode_literal(self, body):
+        px, py = self.last_new_pos()
+        x, y = _parse_pos(body[0])
+        nx, ny = _parse_pos(body[9])
+        return ["R", x - px, y - py, *body[1:9], nx - x, ny - y, body[10]]
+
+    def decode_literal(self, record):
+        px, py = self.last_new_pos()
+        x, y = px + int(record[1]), py + int(record[2])
+        nx, ny = x + int(record[11]), y + int(record[12])
+        return (_format_pos(x, y), *record[3:11], _format_pos(nx, ny), record[13])
+
+# --- Escritura ---
+class CompressedTraceWriter:
+    """Escribe filas con el formato de trace_row() detectando secuencias repetidas.
+
+    Cuando una fila coincide con una fila literal anterior con la misma posición,
+    orientación y percepción, el agente reflejo entró en un ciclo: las filas que
+    siguen se comparan con las del ciclo y solo se cuentan. Escribir una fila
+    dentro de un ciclo cuesta una comparación de tuplas.
+    """
+
+    def __init__(self, f, state):
+        self.file = f
+        self._csv = csv.writer(f)
+        self._state = state
+
+    @classmethod
+    def create(cls, path, header, first_iteration=1):
+        f = open(path, "w", newline='', encoding='utf-8')
+        writer = csv.writer(f)
+        writer.writerow([MAGIC, VERSION, first_iteration])
+        writer.writerow(header)
+        return cls(f, _TraceState(first_iteration))
+
+    @classmethod
+    def reopen(cls, path):
+        """Reconstruye el estado leyendo el archivo y sigue escribiendo al final (para reanudar)"""
+        with open(path, newline='', encoding='utf-8') as f:
+            state = _replay(csv.reader(f))
+        if state.cycle is not None:
+            # Continuar el mismo ciclo en un registro nuevo
+            desde, periodo, fase, filas = state.cycle
+            state.cycle = [desde, periodo, (fase + filas) % periodo, 0]
+        return cls(open(path, "a", newline='', encoding='utf-8'), state)
+
+    def writerow(self, row):
+        state = self._state
+        if int(row[0]) != state.next_iteration:
+            raise ValueError(f"Se esperaba la iteración {state.next_iteration} y llegó {row[0]}")
+        state.next_iteration += 1
+        body = tuple(row[1:])
+
+        if state.cycle is not None:
+            desde, periodo, fase, filas = state.cycle
+            if body == state.literal(desde + (fase + filas) % periodo):
+                state.cycle[3] += 1
+                state.last_body = body
+                return
+            self._end_cycle()
+
+        j = state.keys.get(body[:7])
+        total = state.base + len(state.literals)
+        if j is not None and j >= state.base and total - j <= MAX_PERIOD and state.literal(j) == body:
+            state.cycle = [j, total - j, 0, 1]
+        else:
+            self._csv.writerow(state.encode_literal(body))
+            state.add_literal(body)
+        state.last_body = body
+
+    def _end_cycle(self):
+        self.flush_pending()
+        self._state.cycle = None
+
+    def flush_pending(self):
+        """Escribe las filas del ciclo contadas hasta ahora; el ciclo sigue activo"""
+        cycle = self._state.cycle
+        if cycle is not None and cycle[3] > 0:
+            desde, periodo, fase, filas = cycle
+            self._csv.writerow(["C", desde, periodo, fase, filas])
+            cycle[2], cycle[3] = (fase + filas) % periodo, 0
+
+    def close(self):
+        self.flush_pending()
+        self.file.close()
+
+# --- Lectura ---
+def _read_header(reader):
+    magic = next(reader, None)
+    if not magic or magic[0] != MAGIC or int(magic[1]) != VERSION:
+        raise ValueError("No es una traza comprimida compatible")
+    return int(magic[2]), next(reader)
+
+def _read_literal(state, record):
+    body = state.decode_literal(record)
+    state.add_literal(body)
+    state.cycle = None
+    state.last_body = body
+    return body
+
+def _read_cycle(state, record):
+    desde, periodo, fase, filas = (int(v) for v in record[1:])
+    state.cycle = [desde, periodo, fase, filas]
+    return desde, periodo, fase, filas
+
+def _records(reader, state):
+    """Recorre los registros actualizando `state`; produce el cuerpo de cada fila expandida"""
+    for record in reader:
+        if record[0] == "R":
+            yield _read_literal(state, record)
+        elif record[0] == "C":
+            desde, periodo, fase, filas = _read_cycle(state, record)
+            for m in range(filas):
+                state.last_body = state.literal(desde + (fase + m) % periodo)
+                yield state.last_body
+        else:
+            raise ValueError(f"Registro desconocido: {record[0]!r}")
+
+def _replay(reader):
+    """Estado del codificador al final del archivo, sin expandir los ciclos"""
+    first_iteration, _ = _read_header(reader)
+    state = _TraceState(first_iteration)
+    for record in reader:
+        if record[0] == "R":
+            _read_literal(state, record)
+            state.next_iteration += 1
+        elif record[0] == "C":
+            desde, periodo, fase, filas = _read_cycle(state, record)
+            state.last_body = state.literal(desde + (fase + filas - 1) % periodo)
+            state.next_iteration += filas
+        else:
+            raise ValueError(f"Registro desconocido: {record[0]!r}")
+    return state
+
+def decode_rows(path):
+    """Produce la cabecera y luego cada fila con el mismo formato que trace_row()"""
+    with open(path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        first_iteration, header = _read_header(reader)
+        yield header
+        state = _TraceState(first_iteration)
+        for iteracion, body in enumerate(_records(reader, state), start=first_iteration):
+            yield [str(iteracion), *body]
+
+def expand(path, output_path):
+    """Reconstruye el CSV original byte a byte"""
+    with open(output_path, "w", newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        count = -1  # Sin contar la cabecera
+        for row in decode_rows(path):
+            writer.writerow(row)
+            count += 1
+    return count
+
+def compress(csv_path, output_path):
+    """Comprime una traza CSV existente de salida/"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        first = next(reader, None)
+        writer = CompressedTraceWriter.create(output_path, header, int(first[0]) if first else 1)
+        if first is not None:
+            writer.writerow(first)
+        for row in reader:
+            writer.writerow(row)
+    writer.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Comprime o expande trazas de salida/ detectando ciclos")
+    parser.add_argument("accion", choices=["comprimir", "expandir"])
+    parser.add_argument("archivo")
+    parser.add_argument("-o", "--salida", default=None)
+    args = parser.parse_args()
+
+    base = os.path.splitext(args.archivo)[0]
+    if args.accion == "comprimir":
+        output = args.salida or base + ".trz"
+        compress(args.archivo, output)
+    else:
+        output = args.salida or base + ".csv"
+        rows = expand(args.archivo, output)
+        print(f"Filas expandidas: {rows}")
+    before, after = os.path.getsize(args.archivo), os.path.getsize(output)
+    print(f"{args.archivo} ({before} bytes) -> {output} ({after} bytes)")
+
+if __name__ == "__main__":
+    main()
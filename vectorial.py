@@ -0,0 +1,179 @@
+import numpy as np
+
+import agente
+
+# --- Codificación ---
+# Acciones primitivas, en el mismo sentido de giro que ejecutar()
+ACTIONS = ['AVANZAR', 'ROTAR+90', 'ROTAR-90']
+AVANZAR, ROTAR_MAS_90, ROTAR_MENOS_90 = range(3)
+ORIENTS = ['N', 'E', 'S', 'W']
+
+# Desplazamientos por orientación (mismo orden que ORIENTS)
+MOVES = np.array([(-1, 0), (0, 1), (1, 0), (0, -1)], dtype=np.int64)
+# Celdas izquierda, centro y derecha por orientación, como en sense()
+SENSE_OFFSETS = np.array([
+    [(-1, -1), (-1, 0), (-1, 1)],
+    [(-1, 1), (0, 1), (1, 1)],
+    [(1, 1), (1, 0), (1, -1)],
+    [(1, -1), (0, -1), (-1, -1)],
+], dtype=np.int64)
+
+# Una percepción se codifica como entero en [0, 108):
+#   piso*54 + izq*18 + cen*6 + der*2 + contacto, con P=0, .=1, L=2.
+# Como el valor de una celda es -1/0/1, su símbolo es simplemente valor + 1.
+# El orden coincide con evolucion.PERCEPTIONS.
+NUM_PERCEPTS = 108
+CELL_SYMBOLS = 'P.L'
+
+def decode_percept(code):
+    """Convierte un código entero en la tupla (piso, izq, cen, der, contacto) de sense()"""
+    code = int(code)
+    piso, code = divmod(code, 54)
+    izq, code = divmod(code, 18)
+    cen, code = divmod(code, 6)
+    der, contacto = divmod(code, 2)
+    return (str(piso), CELL_SYMBOLS[izq], CELL_SYMBOLS[cen], CELL_SYMBOLS[der], str(contacto))
+
+def encode_percept(percep):
+    piso, izq, cen, der, contacto = percep
+    return (int(piso) * 54 + CELL_SYMBOLS.index(izq) * 18 + CELL_SYMBOLS.index(cen) * 6
+            + CELL_SYMBOLS.index(der) * 2 + int(contacto))
+
+# --- Entorno vectorial ---
+class VectorEnv:
+    """B copias independientes del entorno avanzadas con operaciones NumPy por lote.
+
+    El estado vive en arrays preasignados (mapas, posición, orientación, contacto).
+    step() y reset() solo escriben en buffers propios (con `out=` y np.take sobre
+    la vista plana de los mapas), así que un paso no reserva memoria proporcional
+    a B y su costo en Python es constante.
+    """
+
+    def __init__(self, num_envs, rows=agente.ROWS, cols=agente.COLS, density=agente.DENSITY,
+                 max_steps=500, line_reward=1.0, contact_penalty=1.0):
+        self.num_envs = num_envs
+        self.rows, self.cols = rows, cols
+        self.density = density
+        self.max_steps = max_steps
+        self.line_reward = line_reward
+        self.contact_penalty = contact_penalty
+
+        self.grids = np.zeros((num_envs, rows, cols), dtype=np.int8)
+        self.x = np.zeros(num_envs, dtype=np.int64)
+        self.y = np.zeros(num_envs, dtype=np.int64)
+        self.orient = np.zeros(num_envs, dtype=np.int64)
+        self.contact = np.zeros(num_envs, dtype=np.int64)
+        self.steps = np.zeros(num_envs, dtype=np.int64)
+
+        # Índices lineales sobre la vista plana de los mapas: b*rows*cols + x*cols + y
+        self._cells = self.grids.reshape(-1)
+        self._base = np.arange(num_envs, dtype=np.int64) * (rows * cols)
+        self._move_dx = MOVES[:, 0].copy()
+        self._move_dy = MOVES[:, 1].copy()
+        self._sense_offsets = (SENSE_OFFSETS[..., 0] * cols + SENSE_OFFSETS[..., 1]).reshape(-1)  # orient*3 + k
+
+        self._env_index = np.arange(num_envs)
+        self._obs = np.zeros(num_envs, dtype=np.int64)
+        self._rewards = np.zeros(num_envs, dtype=np.float32)
+        self._penalty = np.zeros(num_envs, dtype=np.float32)
+        self._dones = np.zeros(num_envs, dtype=bool)
+        self._nx = np.zeros(num_envs, dtype=np.int64)
+        self._ny = np.zeros(num_envs, dtype=np.int64)
+        self._pos = np.zeros(num_envs, dtype=np.int64)
+        self._cell = np.zeros(num_envs, dtype=np.int8)
+        self._free = np.zeros(num_envs, dtype=bool)
+        self._blocked = np.zeros(num_envs, dtype=bool)
+        self._moving = np.zeros(num_envs, dtype=bool)
+        self._tmp = np.zeros(num_envs, dtype=np.int64)
+
+    def reset(self, seeds=None, mask=None):
+        """Genera mapas nuevos con create_map (uno por semilla) para las copias indicadas por `mask`"""
+        indices = np.flatnonzero(mask) if mask is not None else self._env_index
+        if seeds is None:
+            seeds = [None] * len(indices)
+        if len(seeds) != len(indices):
+            raise ValueError(f"Se esperaban {len(indices)} semillas y se recibieron {len(seeds)}")
+
+        for b, seed in zip(indices, seeds):
+            world = agente.World.generate(self.rows, self.cols, density=self.density, seed=seed)
+            agent = agente.Agent(world)
+            self.grids[b] = world.grid
+            self.x[b], self.y[b] = agent.x, agent.y
+            self.orient[b] = ORIENTS.index(agent.orient)
+        self.contact[indices] = 0
+        self.steps[indices] = 0
+        return self._sense()
+
+    def _linear(self, x, y, out):
+        """out = índice lineal de la celda (x, y) de cada copia"""
+        np.multiply(x, self.cols, out=out)
+        np.add(out, y, out=out)
+        np.add(out, self._base, out=out)
+        return out
+
+    def _gather(self, positions):
+        """Valor de la celda en cada índice lineal, en self._cell"""
+        # mode="clip" evita la copia intermedia que hace np.take con out= y mode="raise"
+        return np.take(self._cells, positions, out=self._cell, mode="clip")
+
+    def step(self, actions):
+        """Aplica una acción primitiva por copia; devuelve (percepciones, recompensas, fines)"""
+        actions = np.asarray(actions)
+
+        # Giros: ROTAR+90 resta 1 a la orientación y ROTAR-90 suma 1, como en ejecutar()
+        np.equal(actions, ROTAR_MAS_90, out=self._moving)
+        np.subtract(self.orient, self._moving, out=self.orient)
+        np.equal(actions, ROTAR_MENOS_90, out=self._moving)
+        np.add(self.orient, self._moving, out=self.orient)
+        np.remainder(self.orient, 4, out=self.orient)
+
+        # Avance: solo si la celda destino no es pared; si no, hay contacto
+        np.equal(actions, AVANZAR, out=self._moving)
+        np.take(self._move_dx, self.orient, out=self._nx, mode="clip")
+        np.add(self._nx, self.x, out=self._nx)
+        np.take(self._move_dy, self.orient, out=self._ny, mode="clip")
+        np.add(self._ny, self.y, out=self._ny)
+        np.not_equal(self._gather(self._linear(self._nx, self._ny, self._pos)), -1, out=self._free)
+        np.logical_and(self._free, self._moving, out=self._free)
+        np.copyto(self.x, self._nx, where=self._free)
+        np.copyto(self.y, self._ny, where=self._free)
+        np.logical_not(self._free, out=self._blocked)
+        np.copyto(self.contact, self._blocked, where=self._moving)
+
+        self.steps += 1
+        obs = self._sense()
+
+        # Recompensa: +line_reward sobre línea, -contact_penalty al chocar
+        # (_sense() dejó en self._cell el valor de la celda de cada agente)
+        np.equal(self._cell, 1, out=self._dones)
+        np.multiply(self._dones, self.line_reward, out=self._rewards)
+        np.multiply(self.contact, self.contact_penalty, out=self._penalty)
+        np.subtract(self._rewards, self._penalty, out=self._rewards)
+        np.greater_equal(self.steps, self.max_steps, out=self._dones)
+        return obs, self._rewards, self._dones
+
+    def _sense(self):
+        """Calcula los códigos de percepción de todas las copias en self._obs"""
+        pos = self._linear(self.x, self.y, self._pos)
+        for k, weight in enumerate((18, 6, 2)):
+            # Celda k (izquierda, centro, derecha) según la orientación de cada copia
+            np.multiply(self.orient, 3, out=self._tmp)
+            np.add(self._tmp, k, out=self._tmp)
+            np.take(self._sense_offsets, self._tmp, out=self._tmp, mode="clip")
+            np.add(self._tmp, pos, out=self._tmp)
+            np.add(self._gather(self._tmp), 1, out=self._tmp)
+            np.multiply(self._tmp, weight, out=self._tmp)
+            if k == 0:
+                np.copyto(self._obs, self._tmp)
+            else:
+                np.add(self._obs, self._tmp, out=self._obs)
+        np.add(self._obs, self.contact, out=self._obs)
+        # El piso se deja para el final: así self._cell queda con la celda del agente
+        np.equal(self._gather(pos), 1, out=self._free)
+        np.multiply(self._free, 54, out=self._tmp)
+        np.add(self._obs, self._tmp, out=self._obs)
+        return self._obs
+
+    def percepts(self):
+        """Percepciones actuales en el formato de sense(), útil para depurar"""
+        return [decode_percept(code) for code in self._obs]